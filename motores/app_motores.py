@@ -1,12 +1,17 @@
+import time
+
 import streamlit as st
 import data
-
-from tabs.especifico import render_especifico_tab
-from tabs.resumen import render_resumen_tab
-from tabs.analisis import render_analisis_tab
+import perf
 
 st.set_page_config(layout="wide", page_title="Análisis de Motores", page_icon="🚜")
 
+# Instrumentación opcional del proceso con MOTORES_PERF=1 (ver perf.py). ?perf=1 / ?perf=0 en la
+# URL solo muestra u oculta el panel en esta sesión
+if "perf" in st.query_params:
+    st.session_state["perf_panel"] = st.query_params["perf"] == "1"
+rerun_start = time.perf_counter()
+
 st.title("Análisis de Motores")
 
 ####
@@ -25,23 +30,48 @@ uploaded_reglas = st.sidebar.file_uploader(
     help="Debe contener la hoja 'REGLAS'"
 )
 
+uploaded_incrementales = st.sidebar.file_uploader(
+    "Archivos incrementales con muestras nuevas (opcional)",
+    type=["xlsx", "xls"],
+    accept_multiple_files=True,
+    help="Hoja 'DATOS' solo con las muestras nuevas; se agregan a la base en el orden de carga"
+)
+
 if uploaded_motores is None or uploaded_reglas is None:
     st.warning("Por favor, carga ambos archivos para continuar.")
     st.stop()
 
-data.load_data(uploaded_motores, uploaded_reglas)
+# Contexto de datos propio de esta sesión (compartido solo con sesiones que suben los mismos archivos)
+ctx = data.load_data(uploaded_motores, uploaded_reglas, uploaded_incrementales)
 
 # === TABS ===
-tab_resumen, tab_especifico, tab_analisis = st.tabs(["General", "Específico", "Análisis"])
+# Pestañas perezosas: solo corre la pestaña abierta, y su módulo (plotly, networkx, ...) se
+# importa la primera vez que se abre
+tab_resumen, tab_especifico, tab_analisis = st.tabs(
+    ["General", "Específico", "Análisis"],
+    key="tab_principal",
+    on_change="rerun"
+)
 
 with tab_resumen:
 
-    render_resumen_tab()
+    if tab_resumen.open:
+        from tabs.resumen import render_resumen_tab
+        render_resumen_tab(ctx)
 
 with tab_especifico:
 
-    render_especifico_tab()
+    if tab_especifico.open:
+        from tabs.especifico import render_especifico_tab
+        render_especifico_tab(ctx)
 
 with tab_analisis:
 
-    render_analisis_tab()
+    if tab_analisis.open:
+        from tabs.analisis import render_analisis_tab
+        render_analisis_tab(ctx)
+
+if perf.ENABLED:
+    perf.record("app_rerun", time.perf_counter() - rerun_start)
+if st.session_state.get("perf_panel", perf.ENABLED):
+    perf.render_perf_panel(ctx)
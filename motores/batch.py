@@ -0,0 +1,118 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from ingesta import read_sheet, feather
+from pipeline import SEVERITY, build_config, evaluate_fleet, fleet_projections, apply_datos_schema, risk_trends
+
+# ------------------- Evaluación de flota sin navegador -------------------
+# Mismo pipeline que la app (detección, severidad y tiempo a límite) sin importar Streamlit,
+# pensado para cron:
+#   python batch.py --reglas Reglas.xlsx --salida resultados/ datos/*.xlsx
+# Cada libro DATOS se evalúa en un proceso aparte y genera, con el nombre del libro como prefijo:
+#   <libro>_estado       última toma por equipo con su severidad y las horas a crítico de Análisis
+#                        (ttl_min: menor tiempo a límite de los ajustes en riesgo, ver pipeline.risk_trends;
+#                        vacío en equipos ya críticos o sin ajuste confiable)
+#   <libro>_anomalias    anomalías de la última toma, con severidad, motivo y acción
+#   <libro>_proyecciones regresiones de los parámetros críticos que van hacia su límite
+
+LAST_N_DEFAULT = 5  # últimas tomas por regresión, como en la pestaña Análisis
+
+
+def latest_status(evaluation, projections, config):
+    latest = evaluation.latest_rows
+    estado = pd.DataFrame({
+        "equipo": latest[config.col_equipos].to_numpy(),
+        "fecha": latest[config.col_fecha].to_numpy(),
+        "horometro": latest[config.col_horometro].to_numpy(),
+        "max_priority": latest["max_priority"].to_numpy(),
+        "severidad": [SEVERITY[p]["name"] for p in latest["max_priority"]],
+        "anomaly_count": latest["anomaly_count"].to_numpy(),
+    })
+
+    # Horas a crítico como en Análisis: menor tiempo a límite en riesgo por equipo y el indicador que lo marca
+    at_risk = risk_trends(projections, evaluation.latest_rows, config).sort_values("ttl", kind="stable")
+    first = at_risk.drop_duplicates("equipo").set_index("equipo")
+    estado["ttl_min"] = estado["equipo"].map(first["ttl"])
+    estado["ttl_indicador"] = estado["equipo"].map(first["name"])
+    return estado
+
+
+def latest_anomalies_table(evaluation):
+    # Filas de la tabla de hechos de la última toma de cada equipo, con motivo y acción
+    anomalies = evaluation.sample_anomalies
+    anomalies = anomalies[anomalies["row"].isin(evaluation.latest_rows.index)]
+
+    rules = evaluation.rules_index.lookup
+    found = [rules.get(key) or {} for key in zip(anomalies["column"], anomalies["tipo"])]
+    return anomalies.drop(columns="row").assign(
+        motivo=[rule.get("motivo", "No disponible") for rule in found],
+        accion=[rule.get("accion", "No disponible") for rule in found],
+    )[["equipo", "horometro", "name", "column", "value", "tipo", "limite", "severidad", "priority", "grupo", "mensaje", "motivo", "accion"]]
+
+
+def write_table(df, path, fmt):
+    if fmt == "parquet":
+        df.to_parquet(path.with_suffix(".parquet"), index=False)
+    else:
+        df.to_csv(path.with_suffix(".csv"), index=False)
+
+
+def evaluate_workbook(datos_path, df_acciones, out_dir, fmt, last_n):
+    start = time.perf_counter()
+    config = build_config()
+    # Sin caché columnar: un cron sobre muchos libros no debe desplazar las conversiones del servidor
+    df = apply_datos_schema(read_sheet(datos_path, sheet_name="DATOS", cache=False), config)
+
+    evaluation = evaluate_fleet(df, df_acciones, config)
+    projections = fleet_projections(evaluation, config, last_n)
+
+    prefix = Path(out_dir) / Path(datos_path).stem
+    write_table(latest_status(evaluation, projections, config), prefix.with_name(f"{prefix.name}_estado"), fmt)
+    write_table(latest_anomalies_table(evaluation), prefix.with_name(f"{prefix.name}_anomalias"), fmt)
+    write_table(projections, prefix.with_name(f"{prefix.name}_proyecciones"), fmt)
+    return datos_path, len(df), len(evaluation.latest_rows), time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluación de flota sin interfaz (detección, severidad y tiempo a límite).")
+    parser.add_argument("datos", nargs="+", help="Libros con la hoja DATOS")
+    parser.add_argument("--reglas", required=True, help="Libro con la hoja REGLAS")
+    parser.add_argument("--salida", default=".", help="Directorio de salida")
+    parser.add_argument("--formato", choices=["parquet", "csv"], default="parquet" if feather is not None else "csv")
+    parser.add_argument("--ultimas-tomas", type=int, default=LAST_N_DEFAULT, help="Tomas por regresión (min 3)")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count(), help="Libros evaluados en paralelo")
+    args = parser.parse_args(argv)
+
+    if args.formato == "parquet" and feather is None:
+        parser.error("--formato parquet requiere pyarrow")
+
+    Path(args.salida).mkdir(parents=True, exist_ok=True)
+    df_acciones = pd.read_excel(args.reglas, sheet_name="REGLAS")
+    last_n = max(3, args.ultimas_tomas)
+
+    failed = 0
+    workers = max(1, min(args.procesos or 1, len(args.datos)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(evaluate_workbook, path, df_acciones, args.salida, args.formato, last_n): path
+            for path in args.datos
+        }
+        for future, path in futures.items():
+            try:
+                _, n_samples, n_equipos, elapsed = future.result()
+                print(f"{path}: {n_samples} tomas, {n_equipos} equipos en {elapsed:.2f}s")
+            except Exception as exc:  # un libro dañado no detiene el resto
+                failed += 1
+                print(f"{path}: error {exc!r}", file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
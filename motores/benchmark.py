@@ -0,0 +1,269 @@
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import ingesta
+from pipeline import SEVERITY, build_config, build_params, evaluate_fleet, fleet_projections
+from pipeline import historico_aggregates, historico_frame, detect_anomalies_frame
+from pipeline import compile_rules, enrich_anomaly_table, sample_metrics, build_history_index, monthly_fleet_trends
+from pipeline import fleet_trends, apply_datos_schema
+
+# ------------------- Benchmark del pipeline de datos -------------------
+# Genera flotas sintéticas (hojas DATOS y REGLAS con todas las columnas config.col_*) y mide
+# tiempo y memoria pico de cada etapa a varias escalas:
+#   python benchmark.py                          # 50, 500 y 5000 equipos, 20 tomas por equipo
+#   python benchmark.py --equipos 50,500 --excel --json bench.json
+# Con --excel también se escriben los libros y se mide la lectura (Excel y caché columnar)
+# y la carga completa de la app (data.build_dataset).
+#   python benchmark.py --arranque               # solo el arranque en frío contra STARTUP_TARGET_S
+
+SCALES_DEFAULT = "50,500,5000"
+SAMPLES_DEFAULT = 20
+NAN_RATE_DEFAULT = 0.08
+# Lecturas operativas (presiones de cilindro, blow by, temperatura) faltan más a menudo que las de laboratorio
+NAN_RATE_OPERATIVOS = 0.3
+
+
+# Arranque en frío: módulos que la app importa antes de dibujar la pestaña "General".
+# Las dependencias pesadas de Análisis no deben estar entre ellos.
+STARTUP_MODULES = ["streamlit", "data", "perf", "tabs.resumen"]
+STARTUP_HEAVY_MODULES = ["networkx", "statsmodels", "scipy", "plotly.express"]
+STARTUP_TARGET_S = 1.5
+
+
+# ------------------- Flota sintética -------------------
+def _typical_value(p):
+    # Valor "sano" típico a partir de los límites del parámetro
+    if p["min_val"] is not None and p["max_val"] is not None:
+        return (p["min_val"] + p["max_val"]) / 2
+    if p["max_val"] is not None:
+        return p["max_val"] * 0.55
+    return p["min_val"] * 1.3
+
+
+def synthetic_fleet(n_equipos, n_tomas=SAMPLES_DEFAULT, nan_rate=NAN_RATE_DEFAULT, seed=0):
+    rng = np.random.default_rng(seed)
+    config = build_config()
+    params = build_params(config)
+    n = n_equipos * n_tomas
+
+    # Cada equipo arranca en un horómetro y fecha distintos; tomas cada ~250 h y ~1 mes
+    sample = np.tile(np.arange(n_tomas), n_equipos)
+    equipo = np.repeat(np.arange(n_equipos), n_tomas)
+    horometro = np.repeat(rng.uniform(0, 5000, n_equipos), n_tomas) + np.cumsum(
+        rng.choice([250, 250, 250, 500], n).reshape(n_equipos, n_tomas), axis=1).ravel()
+    dias = np.repeat(rng.integers(0, 365, n_equipos), n_tomas) + np.cumsum(
+        rng.integers(15, 45, n).reshape(n_equipos, n_tomas), axis=1).ravel()
+
+    data = {
+        config.col_equipos: np.char.add("EQ", np.char.zfill(equipo.astype(str), 5)),
+        config.col_fecha: pd.Timestamp("2021-01-01") + pd.to_timedelta(dias, unit="D"),
+        config.col_horometro: np.round(horometro),
+    }
+
+    # Cada (equipo, parámetro) tiene su propia deriva con el uso, para que haya tendencias y
+    # algunas tomas fuera de límite
+    for p in params:
+        drift = np.repeat(rng.normal(0, 0.35, n_equipos), n_tomas)
+        values = _typical_value(p) * (1 + drift * sample / n_tomas + rng.normal(0, 0.2, n))
+        rate = NAN_RATE_OPERATIVOS if p["group"] == params[0]["group"] else nan_rate
+        values[rng.random(n) < rate] = np.nan
+        data[p["col"]] = np.round(values, 2)
+
+    return pd.DataFrame(data)
+
+
+def synthetic_rules(seed=0):
+    rng = np.random.default_rng(seed)
+    levels = [SEVERITY[p]["name"] for p in (1, 2, 3)]
+    rows = []
+    for p in build_params(build_config()):
+        for tipo, limit in (("Baja", p["min_val"]), ("Alta", p["max_val"])):
+            if limit is None:
+                continue
+            rows.append({
+                "Indicador": p["col"],
+                "Tipo": tipo,
+                "Severidad Típica": rng.choice(levels, p=[0.4, 0.35, 0.25]),
+                "Posible Motivo": f"{p['name']} {tipo.lower()}",
+                "Acción Recomendada": f"Revisar {p['name']}",
+            })
+    return pd.DataFrame(rows)
+
+
+# ------------------- Medición -------------------
+def measure(fn, repeats=1):
+    # Mejor tiempo de `repeats` corridas sin trazar + una corrida con tracemalloc para la memoria pico
+    best = float("inf")
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def run_scale(n_equipos, n_tomas, nan_rate, repeats, excel, seed):
+    config = build_config()
+    params = build_params(config)
+    param_groups = list(dict.fromkeys(p["group"] for p in params))
+
+    raw = synthetic_fleet(n_equipos, n_tomas, nan_rate, seed)
+    df_acciones = synthetic_rules(seed)
+    rules = compile_rules(df_acciones)
+
+    stages = []
+
+    def stage(name, fn):
+        result, seconds, peak = measure(fn, repeats)
+        stages.append({"etapa": name, "segundos": seconds, "pico_mb": peak / 1024 ** 2})
+        return result
+
+    # Esquema tipado de la carga (equipo categórico, mediciones float32); el resto, sobre el frame compacto
+    df = stage("esquema", lambda: apply_datos_schema(raw, config))
+
+    # Etapas de la carga (lo que hace evaluate_fleet, por partes) y total
+    stage("historico", lambda: historico_frame(historico_aggregates(df, config), config))
+    _, _, anomalies = stage("deteccion", lambda: detect_anomalies_frame(df, params))
+    anomalies = stage("severidad", lambda: enrich_anomaly_table(anomalies, rules))
+    metrics = stage("metricas_por_toma", lambda: sample_metrics(df.index, anomalies))
+    stage("indice_historia", lambda: build_history_index(df.assign(**metrics), config))
+    evaluation = stage("evaluate_fleet", lambda: evaluate_fleet(df, df_acciones, config))
+
+    # Anomalías de la última toma, tendencias mensuales y OLS de flota (Análisis) y regresiones (predictivo)
+    latest = evaluation.latest_rows
+    stage("ultimas_anomalias", lambda: evaluation.sample_anomalies[evaluation.sample_anomalies["row"].isin(latest.index)])
+    stage("tendencias_mensuales", lambda: monthly_fleet_trends(
+        evaluation.df, config, params, param_groups, evaluation.sample_anomalies))
+    stage("regresiones", lambda: fleet_projections(evaluation, config, 5))
+    stage("tendencia_flota", lambda: fleet_trends(evaluation.df, config, params))
+
+    if excel:
+        stages.extend(run_excel_stages(raw, df_acciones, repeats))
+
+    return {
+        "equipos": n_equipos,
+        "tomas": len(df),
+        "anomalias": len(evaluation.sample_anomalies),
+        "df_mb": raw.memory_usage(deep=True).sum() / 1024 ** 2,
+        "df_compacto_mb": df.memory_usage(deep=True).sum() / 1024 ** 2,
+        "anomalias_mb": evaluation.sample_anomalies.memory_usage(deep=True).sum() / 1024 ** 2,
+        "etapas": stages,
+    }
+
+
+def run_excel_stages(df, df_acciones, repeats):
+    import data  # importa Streamlit: solo cuando se mide la carga completa de la app
+
+    stages = []
+    with tempfile.TemporaryDirectory() as tmp:
+        datos_path = Path(tmp) / "motores_base.xlsx"
+        reglas_path = Path(tmp) / "Reglas.xlsx"
+        df.to_excel(datos_path, sheet_name="DATOS", index=False)
+        df_acciones.to_excel(reglas_path, sheet_name="REGLAS", index=False)
+        key = (ingesta.content_hash(datos_path), ingesta.content_hash(reglas_path))
+
+        def cold_load():
+            ingesta.columnar_path(key[0]).unlink(missing_ok=True)
+            return data.build_dataset(datos_path, reglas_path, key)
+
+        # Caché columnar en un directorio temporal para no tocar la del servidor
+        cache_dir = ingesta.COLUMNAR_CACHE_DIR
+        ingesta.COLUMNAR_CACHE_DIR = Path(tmp) / "cache"
+        try:
+            for name, fn in (
+                ("lectura_excel", lambda: pd.read_excel(datos_path, sheet_name="DATOS")),
+                ("carga_app_fria", cold_load),
+                ("lectura_columnar", lambda: ingesta.read_sheet(datos_path, key=key[0])),
+                ("carga_app_columnar", lambda: data.build_dataset(datos_path, reglas_path, key)),
+            ):
+                _, seconds, peak = measure(fn, repeats)
+                stages.append({"etapa": name, "segundos": seconds, "pico_mb": peak / 1024 ** 2})
+        finally:
+            ingesta.COLUMNAR_CACHE_DIR = cache_dir
+    return stages
+
+
+# ------------------- Arranque en frío -------------------
+def startup_time(repeats=3):
+    # Cada medición en un intérprete nuevo (sin módulos ya importados)
+    code = (
+        "import importlib, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"for name in {STARTUP_MODULES!r}: importlib.import_module(name)\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(m for m in {STARTUP_HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    seconds, heavy = [], ""
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True,
+        ).stdout.splitlines()
+        seconds.append(float(out[0]))
+        heavy = out[1] if len(out) > 1 else ""
+    return {
+        "segundos": min(seconds),
+        "objetivo": STARTUP_TARGET_S,
+        "pesados_cargados": [m for m in heavy.split(",") if m],
+        "ok": min(seconds) <= STARTUP_TARGET_S and not heavy,
+    }
+
+
+def print_report(results):
+    for res in results:
+        print(f"\n{res['equipos']} equipos · {res['tomas']} tomas · {res['anomalias']} anomalías")
+        print(f"  memoria: df {res['df_mb']:.1f} MB → {res['df_compacto_mb']:.1f} MB con esquema · anomalías {res['anomalias_mb']:.1f} MB")
+        print(f"  {'etapa':<22}{'segundos':>10}{'pico MB':>10}")
+        for s in res["etapas"]:
+            print(f"  {s['etapa']:<22}{s['segundos']:>10.3f}{s['pico_mb']:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de datos con flotas sintéticas.")
+    parser.add_argument("--equipos", default=SCALES_DEFAULT, help="Escalas separadas por coma (nº de equipos)")
+    parser.add_argument("--tomas", type=int, default=SAMPLES_DEFAULT, help="Tomas por equipo")
+    parser.add_argument("--nan", type=float, default=NAN_RATE_DEFAULT, help="Fracción de valores faltantes de laboratorio")
+    parser.add_argument("--repeticiones", type=int, default=1, help="Se reporta el mejor tiempo")
+    parser.add_argument("--excel", action="store_true", help="Mide también lectura de Excel y la carga de la app")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    parser.add_argument("--arranque", action="store_true", help="Solo mide el arranque en frío (código 1 si supera el objetivo)")
+    args = parser.parse_args(argv)
+
+    if args.arranque:
+        startup = startup_time(max(3, args.repeticiones))
+        heavy = ", ".join(startup["pesados_cargados"]) or "ninguno"
+        print(f"Arranque en frío: {startup['segundos']:.3f}s (objetivo {STARTUP_TARGET_S}s) · módulos pesados cargados: {heavy}")
+        if args.json:
+            Path(args.json).write_text(json.dumps(startup, indent=2))
+        return 0 if startup["ok"] else 1
+
+    results = [
+        run_scale(int(n), args.tomas, args.nan, max(1, args.repeticiones), args.excel, args.semilla)
+        for n in args.equipos.split(",")
+    ]
+    print_report(results)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,128 +1,36 @@
-import streamlit as st
 import pandas as pd
-from types import SimpleNamespace
-import plotly.express as px
-
-# ------------------- Globals (inicialmente None) -------------------
-df = None
-df_historico = None
-df_completo = None
-config = None
-df_acciones = None
-PARAMS = None
-PARAM_GROUPS = None
-latest_df = None
-latest_anomalies = None
+from functools import cached_property
+
+from pipeline import detect_anomalies_frame
+from pipeline import enrich_anomaly_table, sample_metrics, SAMPLE_METRIC_COLUMNS
+from pipeline import anomaly_facts, concat_anomaly_facts
+from pipeline import historico_aggregates, update_historico_aggregates, historico_frame
+from pipeline import build_config, evaluate_fleet, apply_datos_schema, concat_categorical
+from pipeline import build_history_index, history_slice, latest_sample, latest_samples
+from pipeline import fleet_trends, fleet_summary, monthly_fleet_trends
+from pipeline import SEVERITY, SEVERITY_PRIORITY_ORDER_DESC, SEVERITY_PRIORITY_ORDER_ASC
+from cache import BoundedCache
+import perf
+from ingesta import content_hash, read_sheet
 
 # ------------------- Carga de datos base -------------------
-def motores_base(uploaded_file):
+@perf.timed_function()
+def motores_base(uploaded_file, datos_key=None):
     if uploaded_file is None:
         return None, None, None, None
     
-    config = SimpleNamespace(
-        # Columnas
-        col_equipos = "Equipo",
-        col_fecha = "Fecha",
-        col_horometro = "Horometro",
-        col_cil_1 = "CIL1",
-        col_cil_2 = "CIL2",
-        col_cil_3 = "CIL3",
-        col_cil_4 = "CIL4",
-        col_p_carter = "Blow by Carter",
-        col_temp_radiador = "▲ Temp Radiador",
-        col_viscosidad = "Viscosidad",
-        col_fe = "Fe",
-        col_cr = "Cr",
-        col_pb = "Pb",
-        col_cu = "Cu",
-        col_sn = "Sn",
-        col_al = "Al",
-        col_ni = "Ni",
-        col_ag = "Ag",
-        col_silicio = "Silicio",
-        col_b = "B",
-        col_na = "Na",
-        col_mg = "Mg",
-        col_ca = "Ca",
-        col_ba = "Ba",
-        col_p = "P",
-        col_zn = "Zn",
-        col_mo = "Mo",
-        col_ti = "Ti",
-        col_v = "V",
-        col_mn = "Mn",
-        col_cd = "Cd",
-        col_k = "K",
-        col_diesel = "Diesel",
-        col_agua = "Agua",
-        col_oxidacion = "Oxidación",
-        col_sulfatacion = "Sulfatación",
-        col_nitratacion = "Nitracion",
-        col_hollin = "Hollin",
-        col_tbn = "TBN",
-        col_pq = "PQ",
-        # Límites
-        cil_min = 16,
-        cil_max = 35,
-        p_carter_max = 30,
-        temp_rad_min = 7,
-        visc_min = 13,
-        visc_max = 17,
-        fe_max = 70,
-        cr_max = 10,
-        pb_max = 20,
-        cu_max = 25,
-        sn_max = 10,
-        al_max = 10,
-        ni_max = 5,
-        ag_max = 2,
-        silicio_max = 15,
-        b_max = 50,
-        na_max = 30,
-        mg_min = 10,
-        ca_min = 2200,
-        ba_max = 2,
-        p_min = 800,
-        zn_min = 700,
-        mo_max = 100,
-        ti_max = 2,
-        v_max = 1,
-        mn_max = 5,
-        cd_max = 1,
-        k_max = 5,
-        diesel_max = 3,
-        agua_max = 0.2,
-        oxidacion_max = 20,
-        sulfatacion_max = 20,
-        nitratacion_max = 20,
-        hollin_max = 1.8,
-        tbn_min = 5,
-        pq_max = 50,
-    )
-
-    df = pd.read_excel(uploaded_file, sheet_name="DATOS")
+    config = build_config()
 
-    variables = [
-        value for key, value in vars(config).items()
-        if key.startswith('col_') and key not in ['col_equipos', 'col_horometro', 'col_fecha']
-    ]
-
-    df_historico = (
-        df.groupby(config.col_horometro, as_index=False)[variables]
-        .agg(['mean', 'count'])
-        .round(2)
-    )
-    df_historico.columns = [f"{col[0]}_{col[1]}" if col[1] else col[0] for col in df_historico.columns]
-    rename_dict = {f"{var}_mean": var for var in variables}
-    df_historico = df_historico.rename(columns=rename_dict)
-    df_historico = df_historico.sort_values(config.col_horometro)
-    df_historico[config.col_equipos] = "Histórico"
+    df = apply_datos_schema(read_sheet(uploaded_file, sheet_name="DATOS", key=datos_key), config)
 
-    df_completo = pd.concat([df, df_historico], ignore_index=True)
+    # Curva "Histórico" a partir de sumas/conteos por horómetro (acumulables en modo incremental)
+    historico_agg = historico_aggregates(df, config)
+    df_historico = historico_frame(historico_agg, config)
 
-    return df, df_historico, df_completo, config
+    return df, df_historico, config, historico_agg
 
 
+@perf.timed_function()
 def acciones_base(uploaded_rules_file):
     if uploaded_rules_file is None:
         return None
@@ -130,107 +38,10 @@ def acciones_base(uploaded_rules_file):
 
 
 # ------------------- Helpers -------------------
-@st.cache_data(ttl=3600)
-def detect_anomalies(row, params):
-    anomalies = []
-    for p in params:
-        name = p["name"]
-        col = p["col"]
-        min_val = p["min_val"]
-        max_val = p["max_val"]
-        group = p["group"]
-        value = row.get(col)
-        if pd.isna(value):
-            continue
-
-        tipo = None
-        limite = None
-        mensaje = None
-
-        if min_val is not None and max_val is not None:
-            if value < min_val:
-                tipo = "BAJA"
-                limite = min_val
-                mensaje = f"por debajo del mínimo ({min_val:.2f})"
-            elif value > max_val:
-                tipo = "ALTA"
-                limite = max_val
-                mensaje = f"por encima del máximo ({max_val:.2f})"
-        elif min_val is not None and value < min_val:
-            tipo = "BAJA"
-            limite = min_val
-            mensaje = f"por debajo del mínimo ({min_val:.2f})"
-        elif max_val is not None and value > max_val:
-            tipo = "ALTA"
-            limite = max_val
-            mensaje = f"por encima del máximo ({max_val:.2f})"
-
-        if tipo is not None:
-            full_mensaje = f"{name}: {value:.2f} → {tipo.lower()} {mensaje}"
-            anomalies.append({
-                "name": name,
-                "column": col,
-                "value": value,
-                "tipo": tipo,
-                "limite": limite,
-                "mensaje": full_mensaje,
-                "grupo": group
-            })
-    return anomalies
-
-
-@st.cache_data(ttl=3600)
-def get_latest_anomalies(df, config, params):
-    latest_idx = df.groupby(config.col_equipos)[config.col_horometro].idxmax()
-    latest_df = df.loc[latest_idx]
-    result = {}
-    for _, row in latest_df.iterrows():
-        equipo = row[config.col_equipos]
-        anomalies = detect_anomalies(row, params)
-        if anomalies:
-            result[equipo] = anomalies
-    return result
-
-
-@st.cache_data(ttl=3600)
-def enrich_anomalies_with_severity(anomalies, df_acciones):
-    enriched = []
-    name_to_priority = {info["name"]: info["priority"] for info in SEVERITY.values()}
-
-    for anomaly in anomalies:
-        match = df_acciones[
-            (df_acciones["Indicador"] == anomaly["column"]) &
-            (df_acciones["Tipo"].str.upper() == anomaly["tipo"])
-        ]
-        severidad = match.iloc[0].get("Severidad Típica", "Sano") if not match.empty else "Sano"
-        priority = name_to_priority.get(severidad, 0)
-
-        enriched_anomaly = anomaly.copy()
-        enriched_anomaly["severidad"] = severidad
-        enriched_anomaly["priority"] = priority
-        enriched_anomaly["display_indicator"] = f"{anomaly['name']} ({anomaly['tipo'].capitalize()})"
-        enriched.append(enriched_anomaly)
-
-    return enriched
-
+@perf.timed_function()
+def create_indicator_chart(df, config, y_col, title, min_fixed=None, max_fixed=None, use_data_min=False, use_data_max=False):
+    import plotly.express as px  # solo al construir figuras (no en la carga ni en el modo batch)
 
-@st.cache_data(ttl=3600)
-def get_worst_severity(anomalies, df_acciones):
-    if not anomalies:
-        return 0
-    enriched = enrich_anomalies_with_severity(anomalies, df_acciones)
-    return max(a["priority"] for a in enriched) if enriched else 0
-
-
-def compute_row_metrics(row, params, df_acc):
-    anomalies = detect_anomalies(row, params)
-    enriched = enrich_anomalies_with_severity(anomalies, df_acc)
-    max_priority = max((a["priority"] for a in enriched), default=0)
-    anomaly_count = len(enriched)
-    return max_priority, anomaly_count, enriched
-
-
-def create_indicator_chart(df, y_col, title, min_fixed=None, max_fixed=None, use_data_min=False, use_data_max=False):
     fig = px.line(
         df,
         x=config.col_horometro,
@@ -241,6 +52,8 @@ def create_indicator_chart(df, y_col, title, min_fixed=None, max_fixed=None, use
         color_discrete_sequence=["blue"],
     )
     fig.update_traces(selector=dict(name="Histórico"), line=dict(dash="dot", color="lightblue"), opacity=0.8)
+    if f"{y_col}_p10" in df.columns:
+        add_historico_band(fig, df[df[config.col_equipos] == "Histórico"], config, y_col)
 
     y_data = df[y_col].dropna()
     green_y0 = y_data.min() if use_data_min else min_fixed
@@ -257,100 +70,301 @@ def create_indicator_chart(df, y_col, title, min_fixed=None, max_fixed=None, use
     return fig
 
 
-def style_row(row, params, highlight_color="#fff8e1"):
-    styles = [''] * len(row)
-    anomalies = detect_anomalies(row, params)  # ← Ahora usa el parámetro params
-    for anomaly in anomalies:
-        col_idx = row.index.get_loc(anomaly["column"])
-        styles[col_idx] = f'background-color: {highlight_color}'
-    return styles
+def add_historico_band(fig, df_historico, config, y_col, fillcolor="rgba(173, 216, 230, 0.35)"):
+    # Banda p10–p90 de la flota por tramo de horómetro, dibujada debajo del resto de trazas
+    import plotly.graph_objects as go
+
+    x = df_historico[config.col_horometro]
+    fig.add_trace(go.Scatter(
+        x=x, y=df_historico[f"{y_col}_p90"], mode="lines", line=dict(width=0),
+        hoverinfo="skip", showlegend=False,
+    ))
+    fig.add_trace(go.Scatter(
+        x=x, y=df_historico[f"{y_col}_p10"], mode="lines", line=dict(width=0),
+        fill="tonexty", fillcolor=fillcolor, name="Histórico p10–p90",
+        hoverinfo="skip", showlegend=False,
+    ))
+    fig.data = fig.data[-2:] + fig.data[:-2]
+    return fig
 
 
-# ------------------- Severidad -------------------
-SEVERITY = {
-    0: {"priority": 0, "name": "Sano", "label": "Sano", "color": "green", "emoji": "🟢"},
-    1: {"priority": 1, "name": "Atención", "label": "Atención", "color": "yellow", "emoji": "🟡"},
-    2: {"priority": 2, "name": "Precaución", "label": "Precaución", "color": "orange", "emoji": "🟠"},
-    3: {"priority": 3, "name": "Crítico", "label": "Crítico", "color": "red", "emoji": "🔴"},
-}
-SEVERITY_PRIORITY_ORDER_DESC = [3, 2, 1, 0]
-SEVERITY_PRIORITY_ORDER_ASC = [0, 1, 2, 3]
+# ------------------- Caché de figuras por indicador -------------------
+# Las figuras de la pestaña Específico dependen solo de (datos, equipo, columna, límites):
+# se guardan ya construidas para que volver a un equipo o interactuar con otros widgets
+# (p. ej. la selección de la tabla) no reconstruya el px.line de cada indicador.
+FIGURE_CACHE_MAX_ENTRIES = 512
+CHART_FRAME_CACHE_MAX_ENTRIES = 16
 
-# ------------------- Función de carga principal -------------------
-def load_data(uploaded_motores, uploaded_reglas):
-    global df, df_historico, df_completo, config, df_acciones
-    global PARAMS, PARAM_GROUPS, latest_df, latest_anomalies
+_figure_cache = BoundedCache("indicator_charts", max_entries=FIGURE_CACHE_MAX_ENTRIES)
+_chart_frame_cache = BoundedCache("chart_frames", max_entries=CHART_FRAME_CACHE_MAX_ENTRIES)
 
-    if uploaded_motores is None or uploaded_reglas is None:
-        return
 
+def equipment_chart_frame(ctx, equipo):
+    # Muestras del equipo + curva "Histórico" en su rango de horómetro, ordenadas por horómetro
+    def build():
+        config = ctx.config
+        history = ctx.history(equipo).drop(columns=SAMPLE_METRIC_COLUMNS)
+        horometro = history[config.col_horometro]
+
+        # Tramos de la línea base que se solapan con el rango del equipo (horómetro = centro del tramo)
+        half_bin = config.historico_bin_horas / 2
+        df_historico = ctx.df_historico
+        df_historico = df_historico[
+            (df_historico[config.col_horometro] >= horometro.min() - half_bin) &
+            (df_historico[config.col_horometro] <= horometro.max() + half_bin)
+        ]
+        return pd.concat([history, df_historico], ignore_index=True).sort_values(config.col_horometro)
+
+    return _chart_frame_cache.get_or_build((ctx.key, equipo), build)
+
+
+def cached_indicator_chart(ctx, equipo, y_col, title, **chart_params):
+    key = (ctx.key, equipo, y_col, title, tuple(sorted(chart_params.items())))
+    return _figure_cache.get_or_build(
+        key,
+        lambda: create_indicator_chart(equipment_chart_frame(ctx, equipo), ctx.config, y_col, title, **chart_params),
+    )
+
+
+@perf.timed_function()
+def style_anomalies(frame, params, highlight_color="#fff8e1"):
+    # Para Styler.apply(axis=None): máscara de estilos de toda la tabla en una pasada
+    low_mask, high_mask, _ = detect_anomalies_frame(frame, params)
+    styles = pd.DataFrame('', index=frame.index, columns=frame.columns)
+    mask = (low_mask | high_mask).reindex(columns=frame.columns, fill_value=False)
+    return styles.mask(mask, f'background-color: {highlight_color}')
+
+
+# ------------------- Función de carga principal -------------------
+# Artefactos de carga por contenido de (motores, reglas): un rerun con los mismos
+# archivos no vuelve a leer los Excel ni a recalcular nada.
+LOAD_CACHE_MAX_ENTRIES = 4
+LOAD_CACHE_MAX_BYTES = 1024 ** 3
+LOAD_CACHE_TTL = 3600
+
+
+def _dataset_nbytes(ctx):
+    frames = [ctx.frame(name) for name in DataContext.FRAMES] + [ctx.sample_anomalies, ctx.latest_anomalies]
+    return int(sum(frame.memory_usage(index=True, deep=True).sum() for frame in frames))
+
+
+_load_cache = BoundedCache(
+    "load_data",
+    max_entries=LOAD_CACHE_MAX_ENTRIES,
+    max_bytes=LOAD_CACHE_MAX_BYTES,
+    ttl=LOAD_CACHE_TTL,
+    sizeof=_dataset_nbytes,
+)
+
+
+# ------------------- Contexto de datos -------------------
+class DataContext:
+    # Datos cargados y artefactos derivados de un par (motores, reglas). Cada sesión de
+    # Streamlit recibe el suyo desde load_data y lo pasa a las pestañas; dos sesiones con
+    # los mismos archivos comparten la misma instancia (clave = hash de contenido).
+
+    FRAMES = ("df", "df_historico", "df_acciones", "latest_df")
+
+    def __init__(self, key, df, df_historico, config, df_acciones, rules_index,
+                 PARAMS, PARAM_GROUPS, latest_df, latest_anomalies, history_index, sample_anomalies,
+                 historico_agg, fleet_trends):
+        self.key = key
+        self._frames = {
+            "df": df,
+            "df_historico": df_historico,
+            "df_acciones": df_acciones,
+            "latest_df": latest_df,
+        }
+        self.config = config
+        self.rules_index = rules_index
+        self.PARAMS = PARAMS
+        self.PARAM_GROUPS = PARAM_GROUPS
+        self.latest_anomalies = latest_anomalies
+        self.history_index = history_index
+        self.sample_anomalies = sample_anomalies
+        self.historico_agg = historico_agg
+        self.fleet_trends = fleet_trends
+
+    # Los DataFrames compartidos solo se exponen como vistas copy-on-write (siempre activo desde
+    # pandas 3, ver requirements.txt): leerlas no copia nada y cualquier modificación en una
+    # pestaña queda en su propia vista.
+    def frame(self, name):
+        return self._frames[name].copy(deep=False)
+
+    df = property(lambda self: self.frame("df"))
+    df_historico = property(lambda self: self.frame("df_historico"))
+    df_acciones = property(lambda self: self.frame("df_acciones"))
+    latest_df = property(lambda self: self.frame("latest_df"))
+
+    def with_columns(self, name, **columns):
+        # Vista con columnas derivadas para uso local; el frame compartido no cambia
+        return self._frames[name].assign(**columns)
+
+    # Historia por equipo (ordenada por horómetro) vía el índice construido en la carga
+    def history(self, equipo):
+        return history_slice(self.history_index, equipo)
+
+    def last_samples(self, equipo, n):
+        return history_slice(self.history_index, equipo, last_n=n)
+
+    def latest_sample(self, equipo):
+        return latest_sample(self.history_index, equipo)
+
+    def anomalies_for(self, equipo):
+        # Filas de la tabla de hechos de un equipo, en el orden de su historia (ctx.history),
+        # sin recorrer la tabla de toda la flota
+        facts = self.sample_anomalies.iloc[self._anomaly_positions.get(equipo, [])]
+        order = self.history(equipo).index.get_indexer(facts["row"])
+        return facts.iloc[order.argsort(kind="stable")]
+
+    @cached_property
+    def _anomaly_positions(self):
+        # equipo -> posiciones en la tabla de hechos (un solo groupby por conjunto de datos)
+        return self.sample_anomalies.groupby("equipo", observed=True, sort=False).indices
+
+    @property
+    def datos_key(self):
+        return self.key[0]
+
+    @cached_property
+    def indicator_emoji(self):
+        # Peor severidad típica de cada indicador, precompilada en el índice de reglas
+        return {
+            p["name"]: SEVERITY[self.rules_index.worst_priority.get(p["col"], 0)]["emoji"]
+            for p in self.PARAMS
+        }
+
+    @cached_property
+    def fleet_summary(self):
+        # Media y p10/p50/p90 de flota por variable (línea y banda "histórica" del gráfico por fecha)
+        return fleet_summary(self._frames["df"], self.config)
+
+    @cached_property
+    def monthly_trends(self):
+        # Tendencias mensuales de flota (pestaña Análisis): solo dependen del conjunto cargado
+        with perf.timed("monthly_fleet_trends"):
+            return monthly_fleet_trends(self._frames["df"], self.config, self.PARAMS, self.PARAM_GROUPS, self.sample_anomalies)
+
+    @cached_property
+    def correlations(self):
+        corr_cols = [p["col"] for p in self.PARAMS if p["col"] in self.df.select_dtypes(include='number').columns]
+        return corr_cols, self.df[corr_cols].corr().round(3)
+
+
+@perf.timed_function()
+def build_dataset(uploaded_motores, uploaded_reglas, key):
     # Carga básica
-    df, df_historico, df_completo, config = motores_base(uploaded_motores)
+    df, df_historico, config, historico_agg = motores_base(uploaded_motores, key[0])
     df_acciones = acciones_base(uploaded_reglas)
 
-    # Construcción de PARAMS
-    PARAMS = [
-        {"name": "CIL1", "col": config.col_cil_1, "min_val": config.cil_min, "max_val": config.cil_max, "group": "Datos operativos / físicos de la muestra"},
-        {"name": "CIL2", "col": config.col_cil_2, "min_val": config.cil_min, "max_val": config.cil_max, "group": "Datos operativos / físicos de la muestra"},
-        {"name": "CIL3", "col": config.col_cil_3, "min_val": config.cil_min, "max_val": config.cil_max, "group": "Datos operativos / físicos de la muestra"},
-        {"name": "CIL4", "col": config.col_cil_4, "min_val": config.cil_min, "max_val": config.cil_max, "group": "Datos operativos / físicos de la muestra"},
-        {"name": "Blow by Carter", "col": config.col_p_carter, "min_val": None, "max_val": config.p_carter_max, "group": "Datos operativos / físicos de la muestra"},
-        {"name": "▲ Temp Radiador", "col": config.col_temp_radiador, "min_val": config.temp_rad_min, "max_val": None, "group": "Datos operativos / físicos de la muestra"},
-        {"name": "Viscosidad", "col": config.col_viscosidad, "min_val": config.visc_min, "max_val": config.visc_max, "group": "Propiedades del aceite"},
-        {"name": "Fe", "col": config.col_fe, "min_val": None, "max_val": config.fe_max, "group": "Desgaste"},
-        {"name": "Cr", "col": config.col_cr, "min_val": None, "max_val": config.cr_max, "group": "Desgaste"},
-        {"name": "Pb", "col": config.col_pb, "min_val": None, "max_val": config.pb_max, "group": "Desgaste"},
-        {"name": "Cu", "col": config.col_cu, "min_val": None, "max_val": config.cu_max, "group": "Desgaste"},
-        {"name": "Sn", "col": config.col_sn, "min_val": None, "max_val": config.sn_max, "group": "Desgaste"},
-        {"name": "Al", "col": config.col_al, "min_val": None, "max_val": config.al_max, "group": "Desgaste"},
-        {"name": "Ni", "col": config.col_ni, "min_val": None, "max_val": config.ni_max, "group": "Desgaste"},
-        {"name": "Ag", "col": config.col_ag, "min_val": None, "max_val": config.ag_max, "group": "Desgaste"},
-        {"name": "Silicio", "col": config.col_silicio, "min_val": None, "max_val": config.silicio_max, "group": "Contaminación"},
-        {"name": "B", "col": config.col_b, "min_val": None, "max_val": config.b_max, "group": "Aditivos / Contaminación"},
-        {"name": "Na", "col": config.col_na, "min_val": None, "max_val": config.na_max, "group": "Contaminación"},
-        {"name": "Mg", "col": config.col_mg, "min_val": config.mg_min, "max_val": None, "group": "Aditivos"},
-        {"name": "Ca", "col": config.col_ca, "min_val": config.ca_min, "max_val": None, "group": "Aditivos"},
-        {"name": "Ba", "col": config.col_ba, "min_val": None, "max_val": config.ba_max, "group": "Aditivos"},
-        {"name": "P", "col": config.col_p, "min_val": config.p_min, "max_val": None, "group": "Aditivos"},
-        {"name": "Zn", "col": config.col_zn, "min_val": config.zn_min, "max_val": None, "group": "Aditivos"},
-        {"name": "Mo", "col": config.col_mo, "min_val": None, "max_val": config.mo_max, "group": "Aditivos"},
-        {"name": "Ti", "col": config.col_ti, "min_val": None, "max_val": config.ti_max, "group": "Desgaste"},
-        {"name": "V", "col": config.col_v, "min_val": None, "max_val": config.v_max, "group": "Desgaste"},
-        {"name": "Mn", "col": config.col_mn, "min_val": None, "max_val": config.mn_max, "group": "Desgaste"},
-        {"name": "Cd", "col": config.col_cd, "min_val": None, "max_val": config.cd_max, "group": "Desgaste"},
-        {"name": "K", "col": config.col_k, "min_val": None, "max_val": config.k_max, "group": "Contaminación"},
-        {"name": "Diesel", "col": config.col_diesel, "min_val": None, "max_val": config.diesel_max, "group": "Contaminación"},
-        {"name": "Agua", "col": config.col_agua, "min_val": None, "max_val": config.agua_max, "group": "Contaminación"},
-        {"name": "Oxidación", "col": config.col_oxidacion, "min_val": None, "max_val": config.oxidacion_max, "group": "Degradación del aceite"},
-        {"name": "Sulfatación", "col": config.col_sulfatacion, "min_val": None, "max_val": config.sulfatacion_max, "group": "Degradación del aceite"},
-        {"name": "Nitración", "col": config.col_nitratacion, "min_val": None, "max_val": config.nitratacion_max, "group": "Degradación del aceite"},
-        {"name": "Hollín", "col": config.col_hollin, "min_val": None, "max_val": config.hollin_max, "group": "Contaminación"},
-        {"name": "TBN", "col": config.col_tbn, "min_val": config.tbn_min, "max_val": None, "group": "Aditivos"},
-        {"name": "PQ", "col": config.col_pq, "min_val": None, "max_val": config.pq_max, "group": "Desgaste"},
-    ]
-
-    PARAM_GROUPS = list(dict.fromkeys(p["group"] for p in PARAMS))
-
-    # Última toma por equipo + métricas
-    latest_df = (
-        df.sort_values(config.col_horometro, ascending=False)
-        .groupby(config.col_equipos)
-        .head(1)
-        .sort_values(config.col_equipos)
-        .reset_index(drop=True)
+    # Reglas, PARAMS, severidad de todas las muestras e índice por equipo (pipeline.evaluate_fleet)
+    with perf.timed("evaluate_fleet"):
+        evaluation = evaluate_fleet(df, df_acciones, config)
+    df = evaluation.df
+    rules_index = evaluation.rules_index
+    PARAMS = evaluation.PARAMS
+    PARAM_GROUPS = evaluation.PARAM_GROUPS
+    sample_anomalies = evaluation.sample_anomalies
+    history_index = evaluation.history_index
+
+    # Última toma por equipo (ya trae sus métricas) y sus filas de la tabla de hechos
+    latest_df = evaluation.latest_rows
+    latest_anomalies = sample_anomalies[sample_anomalies["row"].isin(latest_df.index)]
+    latest_df = latest_df.reset_index(drop=True)
+
+    # Tendencia lineal de flota de cada parámetro (Análisis General)
+    with perf.timed("fleet_trends"):
+        trends = fleet_trends(df, config, PARAMS)
+
+    return DataContext(
+        key=key,
+        df=df,
+        df_historico=df_historico,
+        config=config,
+        df_acciones=df_acciones,
+        rules_index=rules_index,
+        PARAMS=PARAMS,
+        PARAM_GROUPS=PARAM_GROUPS,
+        latest_df=latest_df,
+        latest_anomalies=latest_anomalies,
+        history_index=history_index,
+        sample_anomalies=sample_anomalies,
+        historico_agg=historico_agg,
+        fleet_trends=trends,
     )
 
-    metrics_list = latest_df.apply(
-        lambda row: compute_row_metrics(row, PARAMS, df_acciones),
-        axis=1
+
+@perf.timed_function()
+def append_dataset(ctx, uploaded_delta, key):
+    # Modo incremental: solo se procesan las muestras nuevas; lo ya calculado de la base se reutiliza
+    config = ctx.config
+    PARAMS = ctx.PARAMS
+    base_df = ctx.frame("df")
+
+    df_new = apply_datos_schema(read_sheet(uploaded_delta, sheet_name="DATOS", key=key[-1]), config)
+    df_new.index = pd.RangeIndex(len(base_df), len(base_df) + len(df_new))
+
+    # Severidad de las muestras nuevas (las etiquetas continúan las de df)
+    _, _, new_anomalies = detect_anomalies_frame(df_new, PARAMS)
+    new_anomalies = anomaly_facts(enrich_anomaly_table(new_anomalies, ctx.rules_index), df_new, config, PARAMS)
+    df_new = df_new.assign(**sample_metrics(df_new.index, new_anomalies))
+
+    df = concat_categorical(base_df, df_new, sort_categories=(config.col_equipos,))
+    sample_anomalies = concat_anomaly_facts(ctx.sample_anomalies, new_anomalies)
+
+    # Curva "Histórico": solo se recalculan los tramos de horómetro con muestras nuevas
+    historico_agg = update_historico_aggregates(ctx.historico_agg, df, df_new, config)
+    df_historico = historico_frame(historico_agg, config)
+
+    # Última toma por equipo sobre el índice actualizado
+    history_index = build_history_index(df, config)
+    latest_df = latest_samples(history_index)
+    latest_anomalies = sample_anomalies[sample_anomalies["row"].isin(latest_df.index)]
+    latest_df = latest_df.reset_index(drop=True)
+
+    with perf.timed("fleet_trends"):
+        trends = fleet_trends(df, config, PARAMS)
+
+    return DataContext(
+        key=key,
+        df=df,
+        df_historico=df_historico,
+        config=config,
+        df_acciones=ctx.frame("df_acciones"),
+        rules_index=ctx.rules_index,
+        PARAMS=PARAMS,
+        PARAM_GROUPS=ctx.PARAM_GROUPS,
+        latest_df=latest_df,
+        latest_anomalies=latest_anomalies,
+        history_index=history_index,
+        sample_anomalies=sample_anomalies,
+        historico_agg=historico_agg,
+        fleet_trends=trends,
     )
-    latest_df["max_priority"] = [m[0] for m in metrics_list]
-    latest_df["anomaly_count"] = [m[1] for m in metrics_list]
-    latest_df["enriched_anomalies"] = [m[2] for m in metrics_list]
 
-    # Anomalías de la última toma
-    latest_anomalies = get_latest_anomalies(df, config, PARAMS)
 
-    # Asignar a globals
-    globals()['latest_df'] = latest_df
-    globals()['latest_anomalies'] = latest_anomalies
+@perf.timed_function()
+def load_data(uploaded_motores, uploaded_reglas, uploaded_deltas=None):
+    if uploaded_motores is None or uploaded_reglas is None:
+        return None
+
+    key = (content_hash(uploaded_motores), content_hash(uploaded_reglas))
+    uploaded_deltas = list(uploaded_deltas or [])
+    delta_hashes = [content_hash(uploaded_delta) for uploaded_delta in uploaded_deltas]
+
+    # Archivos incrementales en orden de carga: cada uno se aplica sobre el contexto anterior,
+    # con clave = clave anterior + hash del archivo nuevo. Se parte del contexto más avanzado
+    # que siga en caché (el final primero): la base solo se relee si no queda ninguno.
+    ctx, applied = None, 0
+    for applied in range(len(delta_hashes), 0, -1):
+        ctx = _load_cache.get(key + tuple(delta_hashes[:applied]))
+        if ctx is not None:
+            break
+    if ctx is None:
+        applied = 0
+        ctx = _load_cache.get_or_build(key, lambda: build_dataset(uploaded_motores, uploaded_reglas, key))
+
+    for uploaded_delta, delta_hash in zip(uploaded_deltas[applied:], delta_hashes[applied:]):
+        parent, key = ctx, ctx.key + (delta_hash,)
+        ctx = _load_cache.get_or_build(key, lambda: append_dataset(parent, uploaded_delta, key))
+    return ctx
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import perf
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # sin pyarrow se lee siempre el Excel
+    pa = None
+    feather = None
+
+# ------------------- Caché columnar en disco -------------------
+# La hoja DATOS se convierte una sola vez a Arrow IPC (feather sin comprimir) con
+# nombre = hash del contenido del Excel. Sobrevive a reinicios del servidor y, al no
+# estar comprimido, permite leer columnas sueltas con memory-map sin copiar el archivo.
+COLUMNAR_CACHE_DIR = Path(os.environ.get("MOTORES_CACHE_DIR", Path(__file__).parent / ".cache"))
+COLUMNAR_CACHE_MAX_FILES = 20
+COLUMNAR_TMP_MAX_AGE = 3600  # s; temporales más viejos son restos de una escritura interrumpida
+
+
+def content_hash(uploaded_file):
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        with open(uploaded_file, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+
+def columnar_path(key, sheet_name="DATOS"):
+    return COLUMNAR_CACHE_DIR / f"{sheet_name.lower()}_{key}.arrow"
+
+
+def _arrow_safe(df):
+    # Columnas object con tipos mezclados (p. ej. números y textos) se guardan como texto
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].map(lambda v: None if pd.isna(v) else str(v))
+    return df
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:  # borrado por otra sesión mientras se listaba
+        return 0
+
+
+def _prune_cache():
+    files = sorted(COLUMNAR_CACHE_DIR.glob("*.arrow"), key=_mtime, reverse=True)
+    for old in files[COLUMNAR_CACHE_MAX_FILES:]:
+        old.unlink(missing_ok=True)
+    # Temporales huérfanos (proceso caído a media escritura); los recientes pueden estar en uso
+    for tmp in COLUMNAR_CACHE_DIR.glob("*.tmp"):
+        if time.time() - _mtime(tmp) > COLUMNAR_TMP_MAX_AGE:
+            tmp.unlink(missing_ok=True)
+
+
+def write_columnar(df, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Temporal único por escritura: dos sesiones (hilos del mismo proceso) pueden convertir
+    # el mismo libro a la vez
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f"{path.stem}.", suffix=".tmp", delete=False) as tmp:
+        tmp_path = Path(tmp.name)
+    try:
+        feather.write_feather(df, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)  # atómico: otra sesión nunca ve un archivo a medio escribir
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    _prune_cache()
+
+
+def read_columnar(path, columns=None):
+    table = feather.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def read_sheet(uploaded_file, sheet_name="DATOS", key=None, cache=True):
+    # cache=False (modo batch): lee el Excel sin escribir ni podar la caché columnar de la app,
+    # con la misma normalización que una lectura cacheada
+    if feather is None or not cache:
+        with perf.timed("read_excel"):
+            df = pd.read_excel(uploaded_file, sheet_name=sheet_name)
+        return df if pa is None else _arrow_safe(df)
+
+    path = columnar_path(key or content_hash(uploaded_file), sheet_name)
+    if path.exists():
+        try:
+            with perf.timed("read_columnar"):
+                df = read_columnar(path)
+            path.touch()
+            return df
+        except (OSError, pa.ArrowInvalid):
+            path.unlink(missing_ok=True)  # archivo dañado: se vuelve a convertir
+
+    with perf.timed("read_excel"):
+        df = pd.read_excel(uploaded_file, sheet_name=sheet_name)
+    # La lectura en frío devuelve lo mismo que luego se leerá del caché columnar
+    df = _arrow_safe(df)
+    try:
+        with perf.timed("write_columnar"):
+            write_columnar(df, path)
+    except (OSError, pa.ArrowInvalid, pa.ArrowTypeError):
+        pass  # sin caché en disco se sigue funcionando, solo más lento
+    return df
+
+
+def read_columns(key, columns, sheet_name="DATOS"):
+    # Lectura memory-mapped de columnas sueltas (p. ej. un parámetro) de una hoja ya convertida
+    path = columnar_path(key, sheet_name)
+    if feather is None or not path.exists():
+        return None
+    return read_columnar(path, columns=columns)
@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from cache import CACHES
+
+# ------------------- Instrumentación (opcional) -------------------
+# Tiempos por etapa del pipeline y por fragmento, estadísticas de las cachés acotadas y
+# memoria de los DataFrames. Las mediciones se activan para todo el proceso con MOTORES_PERF=1;
+# desactivadas, cada medición es una comprobación de un booleano. ?perf=1 en la URL solo muestra
+# el panel en esa sesión. Los contadores son del proceso (todas las sesiones del servidor).
+ENABLED = os.environ.get("MOTORES_PERF", "") not in ("", "0")
+
+_lock = threading.Lock()
+_timings = {}  # etapa -> {"count", "total", "max", "last"}
+
+
+def record(name, seconds):
+    with _lock:
+        stats = _timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0})
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+        stats["last"] = seconds
+
+
+@contextmanager
+def timed(name):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed_function(name=None):
+    # Decorador: tiempo de cada llamada bajo `name` (por defecto, el nombre de la función)
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with timed(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def reset():
+    with _lock:
+        _timings.clear()
+    for cache in CACHES:
+        cache.reset_stats()
+
+
+# ------------------- Lecturas -------------------
+def timings():
+    with _lock:
+        rows = [{"etapa": name, **stats} for name, stats in _timings.items()]
+    for row in rows:
+        row["mean"] = row["total"] / row["count"]
+    return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+
+def cache_stats():
+    rows = [cache.stats() for cache in CACHES]
+    for row in rows:
+        calls = row["hits"] + row["misses"]
+        row["hit_rate"] = row["hits"] / calls if calls else None
+    return rows
+
+
+def frame_memory(ctx):
+    # Memoria (bytes, deep) de los DataFrames compartidos del contexto
+    frames = {name: ctx.frame(name) for name in ctx.FRAMES}
+    frames["sample_anomalies"] = ctx.sample_anomalies
+    return {name: int(frame.memory_usage(index=True, deep=True).sum()) for name, frame in frames.items()}
+
+
+def snapshot(ctx=None):
+    return {
+        "timestamp": time.time(),
+        "timings": timings(),
+        "caches": cache_stats(),
+        "frames": frame_memory(ctx) if ctx is not None else {},
+    }
+
+
+# ------------------- Panel de depuración -------------------
+def render_perf_panel(ctx=None):
+    import pandas as pd
+    import streamlit as st
+
+    data = snapshot(ctx)
+    with st.sidebar.expander("⏱️ Rendimiento", expanded=False):
+        if not ENABLED:
+            st.caption("Tiempos desactivados: iniciar el servidor con MOTORES_PERF=1 para medir las etapas.")
+        st.caption("Tiempos acumulados del proceso (s). Los reruns de un fragmento solo se ven al recargar el panel.")
+        if data["timings"]:
+            st.dataframe(
+                pd.DataFrame(data["timings"])[["etapa", "count", "total", "mean", "max", "last"]].round(4),
+                hide_index=True,
+                use_container_width=True,
+            )
+
+        st.caption("Cachés")
+        st.dataframe(
+            pd.DataFrame(data["caches"])[["name", "entries", "hits", "misses", "hit_rate", "evictions", "bytes"]],
+            hide_index=True,
+            use_container_width=True,
+        )
+
+        if data["frames"]:
+            st.caption("Memoria de DataFrames (MB)")
+            st.dataframe(
+                pd.Series(data["frames"], name="MB").div(1024 ** 2).round(2).rename_axis("frame").reset_index(),
+                hide_index=True,
+                use_container_width=True,
+            )
+
+        st.download_button(
+            "Exportar JSON",
+            data=json.dumps(data, indent=2, default=str),
+            file_name="motores_perf.json",
+            mime="application/json",
+        )
+        # Los contadores son de todo el proceso: solo se reinician con la instrumentación
+        # encendida por el operador (MOTORES_PERF), no desde el panel de cualquier sesión
+        if ENABLED and st.button("Reiniciar contadores del proceso"):
+            reset()
@@ -0,0 +1,806 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# ------------------- Severidad -------------------
+SEVERITY = {
+    0: {"priority": 0, "name": "Sano", "label": "Sano", "color": "green", "emoji": "🟢"},
+    1: {"priority": 1, "name": "Atención", "label": "Atención", "color": "yellow", "emoji": "🟡"},
+    2: {"priority": 2, "name": "Precaución", "label": "Precaución", "color": "orange", "emoji": "🟠"},
+    3: {"priority": 3, "name": "Crítico", "label": "Crítico", "color": "red", "emoji": "🔴"},
+}
+SEVERITY_PRIORITY_ORDER_DESC = [3, 2, 1, 0]
+SEVERITY_PRIORITY_ORDER_ASC = [0, 1, 2, 3]
+SEVERITY_NAME_TO_PRIORITY = {info["name"]: info["priority"] for info in SEVERITY.values()}
+
+# ------------------- Configuración (columnas y límites) -------------------
+def build_config():
+    return SimpleNamespace(
+        # Columnas
+        col_equipos = "Equipo",
+        col_fecha = "Fecha",
+        col_horometro = "Horometro",
+        col_cil_1 = "CIL1",
+        col_cil_2 = "CIL2",
+        col_cil_3 = "CIL3",
+        col_cil_4 = "CIL4",
+        col_p_carter = "Blow by Carter",
+        col_temp_radiador = "▲ Temp Radiador",
+        col_viscosidad = "Viscosidad",
+        col_fe = "Fe",
+        col_cr = "Cr",
+        col_pb = "Pb",
+        col_cu = "Cu",
+        col_sn = "Sn",
+        col_al = "Al",
+        col_ni = "Ni",
+        col_ag = "Ag",
+        col_silicio = "Silicio",
+        col_b = "B",
+        col_na = "Na",
+        col_mg = "Mg",
+        col_ca = "Ca",
+        col_ba = "Ba",
+        col_p = "P",
+        col_zn = "Zn",
+        col_mo = "Mo",
+        col_ti = "Ti",
+        col_v = "V",
+        col_mn = "Mn",
+        col_cd = "Cd",
+        col_k = "K",
+        col_diesel = "Diesel",
+        col_agua = "Agua",
+        col_oxidacion = "Oxidación",
+        col_sulfatacion = "Sulfatación",
+        col_nitratacion = "Nitracion",
+        col_hollin = "Hollin",
+        col_tbn = "TBN",
+        col_pq = "PQ",
+        # Límites
+        cil_min = 16,
+        cil_max = 35,
+        p_carter_max = 30,
+        temp_rad_min = 7,
+        visc_min = 13,
+        visc_max = 17,
+        fe_max = 70,
+        cr_max = 10,
+        pb_max = 20,
+        cu_max = 25,
+        sn_max = 10,
+        al_max = 10,
+        ni_max = 5,
+        ag_max = 2,
+        silicio_max = 15,
+        b_max = 50,
+        na_max = 30,
+        mg_min = 10,
+        ca_min = 2200,
+        ba_max = 2,
+        p_min = 800,
+        zn_min = 700,
+        mo_max = 100,
+        ti_max = 2,
+        v_max = 1,
+        mn_max = 5,
+        cd_max = 1,
+        k_max = 5,
+        diesel_max = 3,
+        agua_max = 0.2,
+        oxidacion_max = 20,
+        sulfatacion_max = 20,
+        nitratacion_max = 20,
+        hollin_max = 1.8,
+        tbn_min = 5,
+        pq_max = 50,
+        # Gráficos de flota: por encima de este nº de puntos se usa WebGL y mín/máx por tramo
+        scatter_point_budget = 5000,
+        # ...y por encima de este nº de equipos, una sola traza (color en el marcador, sin leyenda)
+        scatter_max_traces = 50,
+        # Curva "Histórico": ancho (h) de los tramos de horómetro
+        historico_bin_horas = 250,
+    )
+
+
+# ------------------- Construcción de PARAMS -------------------
+def build_params(config):
+    return [
+        {"name": "CIL1", "col": config.col_cil_1, "min_val": config.cil_min, "max_val": config.cil_max, "group": "Datos operativos / físicos de la muestra"},
+        {"name": "CIL2", "col": config.col_cil_2, "min_val": config.cil_min, "max_val": config.cil_max, "group": "Datos operativos / físicos de la muestra"},
+        {"name": "CIL3", "col": config.col_cil_3, "min_val": config.cil_min, "max_val": config.cil_max, "group": "Datos operativos / físicos de la muestra"},
+        {"name": "CIL4", "col": config.col_cil_4, "min_val": config.cil_min, "max_val": config.cil_max, "group": "Datos operativos / físicos de la muestra"},
+        {"name": "Blow by Carter", "col": config.col_p_carter, "min_val": None, "max_val": config.p_carter_max, "group": "Datos operativos / físicos de la muestra"},
+        {"name": "▲ Temp Radiador", "col": config.col_temp_radiador, "min_val": config.temp_rad_min, "max_val": None, "group": "Datos operativos / físicos de la muestra"},
+        {"name": "Viscosidad", "col": config.col_viscosidad, "min_val": config.visc_min, "max_val": config.visc_max, "group": "Propiedades del aceite"},
+        {"name": "Fe", "col": config.col_fe, "min_val": None, "max_val": config.fe_max, "group": "Desgaste"},
+        {"name": "Cr", "col": config.col_cr, "min_val": None, "max_val": config.cr_max, "group": "Desgaste"},
+        {"name": "Pb", "col": config.col_pb, "min_val": None, "max_val": config.pb_max, "group": "Desgaste"},
+        {"name": "Cu", "col": config.col_cu, "min_val": None, "max_val": config.cu_max, "group": "Desgaste"},
+        {"name": "Sn", "col": config.col_sn, "min_val": None, "max_val": config.sn_max, "group": "Desgaste"},
+        {"name": "Al", "col": config.col_al, "min_val": None, "max_val": config.al_max, "group": "Desgaste"},
+        {"name": "Ni", "col": config.col_ni, "min_val": None, "max_val": config.ni_max, "group": "Desgaste"},
+        {"name": "Ag", "col": config.col_ag, "min_val": None, "max_val": config.ag_max, "group": "Desgaste"},
+        {"name": "Silicio", "col": config.col_silicio, "min_val": None, "max_val": config.silicio_max, "group": "Contaminación"},
+        {"name": "B", "col": config.col_b, "min_val": None, "max_val": config.b_max, "group": "Aditivos / Contaminación"},
+        {"name": "Na", "col": config.col_na, "min_val": None, "max_val": config.na_max, "group": "Contaminación"},
+        {"name": "Mg", "col": config.col_mg, "min_val": config.mg_min, "max_val": None, "group": "Aditivos"},
+        {"name": "Ca", "col": config.col_ca, "min_val": config.ca_min, "max_val": None, "group": "Aditivos"},
+        {"name": "Ba", "col": config.col_ba, "min_val": None, "max_val": config.ba_max, "group": "Aditivos"},
+        {"name": "P", "col": config.col_p, "min_val": config.p_min, "max_val": None, "group": "Aditivos"},
+        {"name": "Zn", "col": config.col_zn, "min_val": config.zn_min, "max_val": None, "group": "Aditivos"},
+        {"name": "Mo", "col": config.col_mo, "min_val": None, "max_val": config.mo_max, "group": "Aditivos"},
+        {"name": "Ti", "col": config.col_ti, "min_val": None, "max_val": config.ti_max, "group": "Desgaste"},
+        {"name": "V", "col": config.col_v, "min_val": None, "max_val": config.v_max, "group": "Desgaste"},
+        {"name": "Mn", "col": config.col_mn, "min_val": None, "max_val": config.mn_max, "group": "Desgaste"},
+        {"name": "Cd", "col": config.col_cd, "min_val": None, "max_val": config.cd_max, "group": "Desgaste"},
+        {"name": "K", "col": config.col_k, "min_val": None, "max_val": config.k_max, "group": "Contaminación"},
+        {"name": "Diesel", "col": config.col_diesel, "min_val": None, "max_val": config.diesel_max, "group": "Contaminación"},
+        {"name": "Agua", "col": config.col_agua, "min_val": None, "max_val": config.agua_max, "group": "Contaminación"},
+        {"name": "Oxidación", "col": config.col_oxidacion, "min_val": None, "max_val": config.oxidacion_max, "group": "Degradación del aceite"},
+        {"name": "Sulfatación", "col": config.col_sulfatacion, "min_val": None, "max_val": config.sulfatacion_max, "group": "Degradación del aceite"},
+        {"name": "Nitración", "col": config.col_nitratacion, "min_val": None, "max_val": config.nitratacion_max, "group": "Degradación del aceite"},
+        {"name": "Hollín", "col": config.col_hollin, "min_val": None, "max_val": config.hollin_max, "group": "Contaminación"},
+        {"name": "TBN", "col": config.col_tbn, "min_val": config.tbn_min, "max_val": None, "group": "Aditivos"},
+        {"name": "PQ", "col": config.col_pq, "min_val": None, "max_val": config.pq_max, "group": "Desgaste"},
+    ]
+
+
+# ------------------- Esquema de la hoja DATOS -------------------
+# Equipo categórico, Fecha datetime64 y mediciones float32 (los límites se comparan también en
+# float32, ver anomaly_masks). El horómetro se deja numérico con su tipo original.
+MEASUREMENT_DTYPE = np.float32
+
+
+def apply_datos_schema(df, config):
+    columns = {}
+    if config.col_equipos in df.columns:
+        columns[config.col_equipos] = df[config.col_equipos].astype("category")
+    if config.col_fecha in df.columns:
+        columns[config.col_fecha] = pd.to_datetime(df[config.col_fecha], errors="coerce")
+    if config.col_horometro in df.columns:
+        columns[config.col_horometro] = pd.to_numeric(df[config.col_horometro], errors="coerce")
+    for col in historico_variables(config):
+        if col in df.columns:
+            columns[col] = pd.to_numeric(df[col], errors="coerce").astype(MEASUREMENT_DTYPE)
+    return df.assign(**columns)
+
+
+def concat_categorical(frame, new_frame, sort_categories=()):
+    # pd.concat de categóricas con categorías distintas devolvería object: se unen antes
+    combined = pd.concat([frame, new_frame])
+    for col in frame.columns:
+        if isinstance(frame[col].dtype, pd.CategoricalDtype) and col in new_frame.columns:
+            combined[col] = pd.Categorical(union_categoricals(
+                [frame[col], new_frame[col].astype("category")],
+                sort_categories=col in sort_categories, ignore_order=True))
+    return combined
+
+
+# ------------------- Curva "Histórico" (línea base de flota por tramo de horómetro) -------------------
+HISTORICO_QUANTILES = {"p10": 0.1, "p50": 0.5, "p90": 0.9}
+
+
+def historico_variables(config):
+    return [
+        value for key, value in vars(config).items()
+        if key.startswith('col_') and key not in ['col_equipos', 'col_horometro', 'col_fecha']
+    ]
+
+
+def historico_bins(horometro, config):
+    # Inicio del tramo de config.historico_bin_horas horas de cada muestra
+    width = config.historico_bin_horas
+    return np.floor(pd.to_numeric(horometro, errors="coerce") / width) * width
+
+
+def historico_aggregates(df, config):
+    # Suma, conteo y cuantiles por tramo, con un solo groupby (sumas en float64)
+    variables = historico_variables(config)
+    wide = {col: "float64" for col in variables if df[col].dtype == MEASUREMENT_DTYPE}
+    grouped = df[variables].astype(wide).groupby(historico_bins(df[config.col_horometro], config).rename(config.col_horometro))
+
+    quantiles = grouped.quantile(list(HISTORICO_QUANTILES.values())).unstack()
+    quantiles = quantiles.rename(columns={q: name for name, q in HISTORICO_QUANTILES.items()}, level=1).reindex(
+        columns=pd.MultiIndex.from_product([variables, list(HISTORICO_QUANTILES)]))
+    return pd.concat([grouped.agg(['sum', 'count']), quantiles], axis=1)
+
+
+def update_historico_aggregates(aggregates, df, df_new, config):
+    # Los cuantiles no se pueden acumular como las sumas: se recalculan (con todas sus muestras)
+    # solo los tramos que reciben muestras nuevas y el resto se conserva
+    touched = historico_bins(df_new[config.col_horometro], config).dropna().unique()
+    in_touched = historico_bins(df[config.col_horometro], config).isin(touched)
+    return pd.concat([
+        aggregates.drop(index=touched, errors="ignore"),
+        historico_aggregates(df[in_touched], config),
+    ]).sort_index()
+
+
+def historico_frame(aggregates, config):
+    # Una fila por tramo (horómetro = centro del tramo): media, conteo y p10/p50/p90 de cada variable
+    def measure(values):
+        return np.round(values, 2).astype(MEASUREMENT_DTYPE)
+
+    columns = {config.col_horometro: aggregates.index.to_numpy() + config.historico_bin_horas / 2}
+    for var in historico_variables(config):
+        counts = aggregates[(var, 'count')].to_numpy()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            columns[var] = measure(np.where(counts > 0, aggregates[(var, 'sum')].to_numpy() / counts, np.nan))
+        columns[f"{var}_count"] = counts
+        for name in HISTORICO_QUANTILES:
+            columns[f"{var}_{name}"] = measure(aggregates[(var, name)].to_numpy())
+    columns[config.col_equipos] = "Histórico"
+    return pd.DataFrame(columns)
+
+
+def fleet_summary(df, config):
+    # Media y percentiles de toda la flota por variable, calculados sobre las muestras (los
+    # percentiles por tramo del Histórico no se pueden promediar en un percentil de flota)
+    values = df[[var for var in historico_variables(config) if var in df.columns]].astype(float)
+    summary = values.quantile(list(HISTORICO_QUANTILES.values())).T
+    summary.columns = list(HISTORICO_QUANTILES)
+    summary.insert(0, "mean", values.mean())
+    return summary
+
+
+# ------------------- Detección vectorizada de anomalías -------------------
+ANOMALY_COLUMNS = ["row", "name", "column", "value", "tipo", "limite", "mensaje", "grupo"]
+
+
+def param_limits(params):
+    # Límites como arrays alineados con PARAMS (NaN = sin límite)
+    min_vals = np.array([np.nan if p["min_val"] is None else p["min_val"] for p in params], dtype=float)
+    max_vals = np.array([np.nan if p["max_val"] is None else p["max_val"] for p in params], dtype=float)
+    return min_vals, max_vals
+
+
+def param_values(df, params, dtype=MEASUREMENT_DTYPE):
+    # Matriz (muestras x parámetros); columnas ausentes o no numéricas quedan como NaN
+    values = np.full((len(df), len(params)), np.nan, dtype=dtype)
+    for j, p in enumerate(params):
+        if p["col"] in df.columns:
+            values[:, j] = pd.to_numeric(df[p["col"]], errors="coerce").to_numpy(dtype=dtype, na_value=np.nan)
+    return values
+
+
+def anomaly_masks(df, params):
+    # Valores y límites en float32: 0.2 leído como float32 no queda "por encima" de un límite 0.2
+    values = param_values(df, params)
+    min_vals, max_vals = (limits.astype(values.dtype) for limits in param_limits(params))
+    # Las comparaciones con NaN (valor o límite) son False, igual que el pd.isna del bucle por fila
+    with np.errstate(invalid="ignore"):
+        low = values < min_vals
+        high = values > max_vals
+    return values, low, high
+
+
+def detect_anomalies_frame(df, params):
+    values, low, high = anomaly_masks(df, params)
+    cols = [p["col"] for p in params]
+    low_mask = pd.DataFrame(low, index=df.index, columns=cols)
+    high_mask = pd.DataFrame(high, index=df.index, columns=cols)
+
+    # np.nonzero recorre en orden fila-mayor: anomalías ordenadas por (muestra, PARAMS)
+    rows, pidx = np.nonzero(low | high)
+    if len(rows) == 0:
+        return low_mask, high_mask, pd.DataFrame(columns=ANOMALY_COLUMNS)
+
+    min_vals, max_vals = param_limits(params)
+    is_low = low[rows, pidx]
+    anom_values = values[rows, pidx]
+    limites = np.where(is_low, min_vals[pidx], max_vals[pidx])
+    names = [params[j]["name"] for j in pidx]
+    tipos = np.where(is_low, "BAJA", "ALTA")
+
+    mensajes = [
+        f"{name}: {value:.2f} → baja por debajo del mínimo ({limite:.2f})" if baja
+        else f"{name}: {value:.2f} → alta por encima del máximo ({limite:.2f})"
+        for name, value, limite, baja in zip(names, anom_values, limites, is_low)
+    ]
+
+    anomalies = pd.DataFrame({
+        "row": df.index[rows],
+        "name": names,
+        "column": [cols[j] for j in pidx],
+        "value": anom_values,
+        "tipo": tipos,
+        "limite": limites,
+        "mensaje": mensajes,
+        "grupo": [params[j]["group"] for j in pidx],
+    })
+    return low_mask, high_mask, anomalies
+
+
+# ------------------- Índice de reglas (hoja REGLAS) -------------------
+def compile_rules(df_acciones):
+    # (Indicador, TIPO) -> severidad, prioridad, motivo y acción; gana la primera fila, como match.iloc[0]
+    has = set(df_acciones.columns)
+    lookup = {}
+    worst_priority = {}
+    critical_indicators = set()
+
+    for row in df_acciones.to_dict("records"):
+        indicador = row.get("Indicador")
+        tipo = row.get("Tipo")
+        severidad = row.get("Severidad Típica") if "Severidad Típica" in has else "Sano"
+
+        if isinstance(tipo, str) and (indicador, tipo.upper()) not in lookup:
+            lookup[(indicador, tipo.upper())] = {
+                "severidad": severidad,
+                "priority": SEVERITY_NAME_TO_PRIORITY.get(severidad, 0),
+                "motivo": row.get("Posible Motivo") if "Posible Motivo" in has else "No disponible",
+                "accion": row.get("Acción Recomendada") if "Acción Recomendada" in has else "No disponible",
+                "severidad_tipica": row.get("Severidad Típica") if "Severidad Típica" in has else "No disponible",
+            }
+
+        # Peor severidad típica por indicador (emoji) e indicadores con alguna regla crítica
+        if "Severidad Típica" in has and isinstance(severidad, str):
+            prio = SEVERITY_NAME_TO_PRIORITY.get(severidad.strip(), 0)
+            worst_priority[indicador] = max(worst_priority.get(indicador, 0), prio)
+            if severidad == SEVERITY[3]["name"]:
+                critical_indicators.add(indicador)
+
+    return SimpleNamespace(
+        lookup=lookup,
+        worst_priority=worst_priority,
+        critical_indicators=critical_indicators,
+    )
+
+
+def lookup_rule(rules, column, tipo):
+    return rules.lookup.get((column, tipo))
+
+
+# ------------------- Severidad por muestra (materializada en la carga) -------------------
+SAMPLE_METRIC_COLUMNS = ["max_priority", "anomaly_count"]
+
+
+def enrich_anomaly_table(anomalies, rules):
+    # Severidad, prioridad e indicador de cada anomalía según el índice de reglas
+    found = [rules.lookup.get(key) for key in zip(anomalies["column"], anomalies["tipo"])]
+    return anomalies.assign(
+        severidad=[rule["severidad"] if rule else "Sano" for rule in found],
+        priority=np.array([rule["priority"] if rule else 0 for rule in found], dtype=int),
+        display_indicator=anomalies["name"] + " (" + anomalies["tipo"].str.capitalize() + ")",
+    )
+
+
+def sample_metrics(index, anomalies):
+    # Severidad máxima y número de anomalías por muestra (0 si no tiene ninguna)
+    by_row = anomalies.groupby("row", sort=False)["priority"]
+    return pd.DataFrame({
+        "max_priority": by_row.max().reindex(index, fill_value=0).astype(int).to_numpy(),
+        "anomaly_count": by_row.size().reindex(index, fill_value=0).astype(int).to_numpy(),
+    }, index=index)
+
+
+# ------------------- Tabla de hechos de anomalías -------------------
+# Una fila por (muestra, parámetro, tipo) con el equipo y el horómetro de la muestra. Las columnas
+# de texto repetitivo son categóricas: los resúmenes de flota son groupby sobre esta tabla.
+ANOMALY_FACT_COLUMNS = [
+    "row", "equipo", "horometro", "name", "column", "value", "tipo", "limite", "mensaje",
+    "grupo", "severidad", "priority", "display_indicator",
+]
+
+
+def anomaly_categories(params):
+    # Categorías fijas (orden de PARAMS / severidad) para que base e incrementales coincidan
+    return {
+        "name": list(dict.fromkeys(p["name"] for p in params)),
+        "column": list(dict.fromkeys(p["col"] for p in params)),
+        "tipo": ["BAJA", "ALTA"],
+        "grupo": list(dict.fromkeys(p["group"] for p in params)),
+        "severidad": [SEVERITY[p]["name"] for p in SEVERITY_PRIORITY_ORDER_ASC],
+        "display_indicator": display_indicators(params)[0],
+    }
+
+
+def anomaly_facts(anomalies, df, config, params):
+    # Tabla larga enriquecida (enrich_anomaly_table) -> tabla de hechos
+    sample = df.loc[anomalies["row"]]
+    facts = anomalies.assign(
+        equipo=pd.Categorical(sample[config.col_equipos].to_numpy()),
+        horometro=sample[config.col_horometro].to_numpy(),
+    )
+    for col, categories in anomaly_categories(params).items():
+        # Valores fuera de lo previsto (p. ej. una severidad escrita a mano en REGLAS) se añaden al final
+        known = set(categories)
+        extra = [v for v in pd.unique(facts[col].dropna()) if v not in known]
+        facts[col] = pd.Categorical(facts[col], categories=categories + extra)
+    facts["priority"] = facts["priority"].astype(int)
+    return facts[ANOMALY_FACT_COLUMNS].reset_index(drop=True)
+
+
+def concat_anomaly_facts(facts, new_facts):
+    return concat_categorical(facts, new_facts, sort_categories=("equipo",)).reset_index(drop=True)
+
+
+# ------------------- Tendencias mensuales de flota (barrido único) -------------------
+def display_indicators(params):
+    # Indicadores con distinción Alta/Baja; el grupo es el mismo para ambas variantes
+    indicators = []
+    indicator_to_group = {}
+    for p in params:
+        if p.get("min_val") is not None:
+            indicators.append(f"{p['name']} (Baja)")
+            indicator_to_group[indicators[-1]] = p["group"]
+        if p.get("max_val") is not None:
+            indicators.append(f"{p['name']} (Alta)")
+            indicator_to_group[indicators[-1]] = p["group"]
+    return indicators, indicator_to_group
+
+
+def monthly_fleet_trends(df, config, params, param_groups, anomalies):
+    # df trae max_priority materializado y anomalies es la tabla larga ya enriquecida
+    indicators, indicator_to_group = display_indicators(params)
+    n_groups = len(param_groups)
+    n_ind = len(indicators)
+    sev_levels = [3, 2, 1]
+
+    # Contadores: [severidad 0..3 | anomalías por grupo | anomalías por (severidad, indicador)]
+    group_offset = 4
+    ind_offset = group_offset + n_groups
+    n_counters = ind_offset + len(sev_levels) * n_ind
+    group_pos = {g: i for i, g in enumerate(param_groups)}
+    ind_pos = {ind: i for i, ind in enumerate(indicators)}
+    sev_pos = {prio: i for i, prio in enumerate(sev_levels)}
+
+    # Contribución de cada muestra a los contadores, a partir de lo calculado en la carga
+    row_pos = df.index.get_indexer(anomalies["row"]) if len(anomalies) else np.array([], dtype=int)
+    contributions = [[] for _ in range(len(df))]
+    for pos, grupo, prio, display in zip(row_pos, anomalies["grupo"], anomalies["priority"], anomalies["display_indicator"]):
+        if pos < 0:
+            continue
+        contributions[pos].append(group_offset + group_pos[grupo])
+        if prio in sev_pos:
+            contributions[pos].append(ind_offset + sev_pos[prio] * n_ind + ind_pos[display])
+    for pos, prio in enumerate(df["max_priority"].to_numpy()):
+        contributions[pos].append(int(prio))
+
+    fecha = pd.to_datetime(df[config.col_fecha])
+    horometro = pd.to_numeric(df[config.col_horometro], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    equipo_codes, _ = pd.factorize(df[config.col_equipos])
+
+    fecha_periods = fecha.dt.to_period('M')
+    monthly_dates = pd.date_range(
+        fecha_periods.min().start_time,
+        fecha_periods.max().end_time,
+        freq="ME"
+    )
+
+    # Orden por fecha una sola vez (estable: a igual fecha respeta el orden original)
+    eligible = np.flatnonzero(fecha.notna().to_numpy() & (equipo_codes >= 0) & ~np.isnan(horometro))
+    order = eligible[np.argsort(fecha.to_numpy()[eligible], kind="stable")]
+    sorted_fechas = fecha.to_numpy()[order]
+    month_stops = np.searchsorted(sorted_fechas, monthly_dates.to_numpy(), side="right")
+
+    # Estado por equipo: posición de su última toma (mayor horómetro; a igualdad, la primera fila)
+    latest = np.full(equipo_codes.max() + 1 if len(equipo_codes) else 0, -1)
+    totals = [0] * n_counters
+    fleet = 0
+    snapshots = np.zeros((len(monthly_dates), n_counters), dtype=int)
+    fleet_sizes = np.zeros(len(monthly_dates), dtype=int)
+    cursor = 0
+    for m, stop in enumerate(month_stops):
+        for pos in order[cursor:stop]:
+            eq = equipo_codes[pos]
+            current = latest[eq]
+            if current == -1:
+                fleet += 1
+            elif horometro[pos] > horometro[current] or (horometro[pos] == horometro[current] and pos < current):
+                for c in contributions[current]:
+                    totals[c] -= 1
+            else:
+                continue
+            latest[eq] = pos
+            for c in contributions[pos]:
+                totals[c] += 1
+        cursor = stop
+        snapshots[m] = totals
+        fleet_sizes[m] = fleet
+
+    # Severidad (% de equipos), con el ajuste de redondeo para que sume 100
+    sev_counts = snapshots[:, :group_offset]
+    trend_rows = []
+    for m, month_end in enumerate(monthly_dates):
+        fleet_month = fleet_sizes[m]
+        pct = np.zeros(4)
+        if fleet_month > 0:
+            pct = np.round(sev_counts[m] / fleet_month * 100, 1)
+            if pct.sum() > 0:
+                difference = 100 - pct.sum()
+                if difference != 0:
+                    pct[np.argmax(pct)] += difference
+        trend_rows.append({
+            "date": month_end,
+            "fleet_size": fleet_month,
+            **{f"pct_{i}": pct[i] for i in range(4)},
+            **{f"count_{i}": sev_counts[m, i] for i in range(4)}
+        })
+
+    # Anomalías por grupo (% sobre el total del mes)
+    group_counts = snapshots[:, group_offset:ind_offset]
+    total_anomalies = group_counts.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        group_pct = np.where(total_anomalies > 0, group_counts / total_anomalies * 100, 0)
+
+    # Anomalías por indicador y severidad (% sobre el total de esa severidad)
+    indicator_trend_counts_by_sev = {}
+    indicator_trend_pct_by_sev = {}
+    for prio in sev_levels:
+        start = ind_offset + sev_pos[prio] * n_ind
+        counts = snapshots[:, start:start + n_ind]
+        total_sev = counts.sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pct = np.where(total_sev > 0, np.round(counts / total_sev * 100, 1), 0)
+        indicator_trend_counts_by_sev[prio] = {ind: counts[:, i].tolist() for i, ind in enumerate(indicators)}
+        indicator_trend_pct_by_sev[prio] = {ind: pct[:, i].tolist() for i, ind in enumerate(indicators)}
+
+    return SimpleNamespace(
+        df_trend=pd.DataFrame(trend_rows),
+        group_trend_counts={g: group_counts[:, i].tolist() for i, g in enumerate(param_groups)},
+        group_trend_pct={g: group_pct[:, i].tolist() for i, g in enumerate(param_groups)},
+        indicator_trend_counts_by_sev=indicator_trend_counts_by_sev,
+        indicator_trend_pct_by_sev=indicator_trend_pct_by_sev,
+        all_display_indicators=indicators,
+        indicator_to_group=indicator_to_group,
+    )
+
+
+# ------------------- Índice de historia por equipo -------------------
+def build_history_index(df, config):
+    # Muestras ordenadas una sola vez por (equipo, horómetro): la historia de cada equipo
+    # es un rango contiguo [start, stop) y se obtiene por slicing, sin filtrar df.
+    frame = df[df[config.col_equipos].notna()].sort_values(
+        [config.col_equipos, config.col_horometro], kind="stable"
+    )
+    codes, equipos = pd.factorize(frame[config.col_equipos])
+    horometro = pd.to_numeric(frame[config.col_horometro], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    positions = np.arange(len(frame))
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(frame) else np.array([], dtype=int)
+    stops = np.r_[starts[1:], len(frame)].astype(int)
+
+    # Última toma = mayor horómetro (los NaN quedan al final del rango); a igualdad de
+    # horómetro, la primera fila del archivo, igual que idxmax
+    nan_counts = np.bincount(codes, weights=np.isnan(horometro), minlength=len(equipos)).astype(int)
+    last_valid = np.maximum(stops - 1 - nan_counts, starts)
+    run_start = np.r_[True, (codes[1:] != codes[:-1]) | (horometro[1:] != horometro[:-1])] if len(frame) else np.array([], dtype=bool)
+    run_first = np.maximum.accumulate(np.where(run_start, positions, 0)) if len(frame) else positions
+    latest = run_first[last_valid] if len(frame) else last_valid
+
+    return SimpleNamespace(
+        frame=frame,
+        equipos=list(equipos),
+        bounds={eq: (int(start), int(stop), int(pos)) for eq, start, stop, pos in zip(equipos, starts, stops, latest)},
+        starts=starts,
+        stops=stops,
+        latest=latest,
+        codes=codes,
+    )
+
+
+def history_slice(index, equipo, last_n=None):
+    start, stop, _ = index.bounds.get(equipo, (0, 0, None))
+    if last_n is not None:
+        start = max(start, stop - last_n)
+    return index.frame.iloc[start:stop]
+
+
+def latest_sample(index, equipo):
+    _, _, pos = index.bounds[equipo]
+    return index.frame.iloc[pos]
+
+
+def latest_samples(index):
+    # Una fila por equipo (su última toma), en orden de equipo
+    return index.frame.iloc[index.latest]
+
+
+# ------------------- Regresiones de tendencia por (equipo, parámetro) -------------------
+TREND_COLUMNS = ["equipo", "name", "col", "n_hist", "n", "slope", "intercept", "r2", "value", "limit", "is_min", "ttl"]
+
+
+def trend_regressions(index, latest_df, config, params, last_n):
+    # Mínimos cuadrados sobre las últimas `last_n` tomas de cada equipo, para todos los
+    # pares (equipo, parámetro) a la vez con sumas agrupadas (mismo resultado que linregress).
+    equipos = index.equipos
+    n_eq = len(equipos)
+    n_hist = index.stops - index.starts
+    in_last = np.arange(len(index.frame)) >= (index.stops - last_n)[index.codes] if n_eq else np.array([], dtype=bool)
+    last = index.frame[in_last]
+    codes = index.codes[in_last]
+    latest_values = latest_df.set_index(config.col_equipos).reindex(equipos)
+    x_all = pd.to_numeric(last[config.col_horometro], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+    results = []
+    for p in params:
+        y_all = param_values(last, [p], dtype=float)[:, 0]
+        valid = ~np.isnan(x_all) & ~np.isnan(y_all)
+        g, x, y = codes[valid], x_all[valid], y_all[valid]
+
+        n = np.bincount(g, minlength=n_eq).astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_x = np.bincount(g, weights=x, minlength=n_eq) / n
+            mean_y = np.bincount(g, weights=y, minlength=n_eq) / n
+            dx = x - mean_x[g]
+            dy = y - mean_y[g]
+            sxx = np.bincount(g, weights=dx * dx, minlength=n_eq)
+            syy = np.bincount(g, weights=dy * dy, minlength=n_eq)
+            sxy = np.bincount(g, weights=dx * dy, minlength=n_eq)
+
+            slope = np.where(sxx > 0, sxy / sxx, np.nan)
+            intercept = mean_y - slope * mean_x
+            r2 = np.where((sxx > 0) & (syy > 0), sxy * sxy / (sxx * syy), 0.0)
+
+            is_min = p["max_val"] is None
+            limit = p["min_val"] if is_min else p["max_val"]
+            value = pd.to_numeric(latest_values[p["col"]], errors="coerce").to_numpy(dtype=float, na_value=np.nan) \
+                if p["col"] in latest_values.columns else np.full(n_eq, np.nan)
+            ttl = (limit - value) / slope if limit is not None else np.full(n_eq, np.nan)
+
+        results.append(pd.DataFrame({
+            "equipo": equipos,
+            "name": p["name"],
+            "col": p["col"],
+            "n_hist": n_hist,
+            "n": n.astype(int),
+            "slope": slope,
+            "intercept": intercept,
+            "r2": r2,
+            "value": value,
+            "limit": limit,
+            "is_min": is_min,
+            "ttl": ttl,
+        }))
+
+    if not results:
+        return pd.DataFrame(columns=TREND_COLUMNS)
+    # Orden (equipo, PARAMS) como los bucles originales
+    order = {p["col"]: i for i, p in enumerate(params)}
+    table = pd.concat(results, ignore_index=True)
+    table["_param_order"] = table["col"].map(order)
+    return table.sort_values(["equipo", "_param_order"], kind="stable").drop(columns="_param_order").reset_index(drop=True)
+
+
+def projectable_trends(trends):
+    # Filtros comunes a ambas secciones predictivas: historia y ajuste suficientes,
+    # pendiente no nula y en dirección al límite.
+    return trends[
+        (trends["n_hist"] >= 3)
+        & trends["value"].notna()
+        & (trends["n"] >= 3)
+        & (trends["slope"].abs() >= 1e-6)
+        & ~(trends["is_min"] & (trends["slope"] > 0))
+        & ~(~trends["is_min"] & (trends["slope"] < 0))
+    ]
+
+
+RISK_TTL_MAX = 10000  # h
+RISK_R2_MIN = 0.3
+
+
+def risk_trends(trends, latest, config):
+    # Tendencias que marcan un equipo "en riesgo" (Análisis y modo batch): equipo aún no
+    # crítico, tiempo a límite positivo de hasta RISK_TTL_MAX h y ajuste con R² >= RISK_R2_MIN
+    non_critical = latest.loc[latest["max_priority"] < 3, config.col_equipos]
+    return trends[
+        trends["equipo"].isin(non_critical)
+        & (trends["ttl"] > 0)
+        & (trends["ttl"] <= RISK_TTL_MAX)
+        & (trends["r2"] >= RISK_R2_MIN)
+    ]
+
+
+# ------------------- Tendencia lineal de flota (todas las tomas) -------------------
+FLEET_TREND_AXES = ("horometro", "fecha")
+
+
+def fecha_seconds(fecha):
+    # Segundos desde 1970 (NaN si no hay fecha), la misma escala que usa plotly para el OLS con fechas
+    fecha = pd.to_datetime(fecha, errors="coerce")
+    return ((fecha - pd.Timestamp("1970-01-01")) / pd.Timedelta(seconds=1)).to_numpy(dtype=float, na_value=np.nan)
+
+
+def fleet_trends(df, config, params):
+    # OLS de cada parámetro contra horómetro y contra fecha sobre toda la flota, para todos
+    # los PARAMS a la vez (columnas de la matriz de valores); sustituye a trendline="ols".
+    values = param_values(df, params, dtype=float)
+    axes = {
+        "horometro": pd.to_numeric(df[config.col_horometro], errors="coerce").to_numpy(dtype=float, na_value=np.nan),
+        "fecha": fecha_seconds(df[config.col_fecha]),
+    }
+
+    tables = []
+    for axis in FLEET_TREND_AXES:
+        x = np.broadcast_to(axes[axis][:, None], values.shape)
+        valid = ~np.isnan(x) & ~np.isnan(values)
+        n = valid.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x_mean = np.where(valid, x, 0).sum(axis=0) / n
+            y_mean = np.where(valid, values, 0).sum(axis=0) / n
+            dx = np.where(valid, x - x_mean, 0)
+            dy = np.where(valid, values - y_mean, 0)
+            sxx = (dx * dx).sum(axis=0)
+            sxy = (dx * dy).sum(axis=0)
+            syy = (dy * dy).sum(axis=0)
+            slope = sxy / sxx
+            r2 = sxy ** 2 / (sxx * syy)
+        tables.append(pd.DataFrame({
+            "col": [p["col"] for p in params],
+            "eje": axis,
+            "n": n,
+            "slope": slope,
+            "intercept": y_mean - slope * x_mean,
+            "r2": r2,
+            "x_min": np.where(valid, x, np.inf).min(axis=0, initial=np.inf),
+            "x_max": np.where(valid, x, -np.inf).max(axis=0, initial=-np.inf),
+        }))
+    return pd.concat(tables, ignore_index=True).set_index(["col", "eje"])
+
+
+# ------------------- Reducción de puntos para gráficos de flota -------------------
+def downsample_minmax(x, y, budget):
+    # Posiciones a dibujar: todas si caben en el presupuesto; si no, la toma con el mínimo y la
+    # del máximo de y en cada uno de budget // 2 tramos iguales de x (conserva picos y rango)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    positions = np.flatnonzero(~np.isnan(x) & ~np.isnan(y))
+    if len(positions) <= budget:
+        return positions
+
+    n_bins = max(1, budget // 2)
+    xv, yv = x[positions], y[positions]
+    span = xv.max() - xv.min()
+    bins = np.zeros(len(xv), dtype=np.int64) if span == 0 else np.minimum(
+        ((xv - xv.min()) / span * n_bins).astype(np.int64), n_bins - 1)
+
+    order = np.lexsort((yv, bins))
+    sorted_bins = bins[order]
+    first = np.flatnonzero(np.r_[True, sorted_bins[1:] != sorted_bins[:-1]])
+    last = np.r_[first[1:] - 1, len(order) - 1]
+    return np.unique(positions[order[np.r_[first, last]]])
+
+
+# ------------------- Evaluación completa de flota (sin Streamlit) -------------------
+def evaluate_fleet(df, df_acciones, config):
+    # Núcleo de la carga compartido por la app (data.build_dataset) y el modo batch
+    rules_index = compile_rules(df_acciones)
+    PARAMS = build_params(config)
+    PARAM_GROUPS = list(dict.fromkeys(p["group"] for p in PARAMS))
+
+    # Severidad de todas las muestras: tabla de hechos de anomalías + max_priority / anomaly_count en df
+    _, _, sample_anomalies = detect_anomalies_frame(df, PARAMS)
+    sample_anomalies = anomaly_facts(enrich_anomaly_table(sample_anomalies, rules_index), df, config, PARAMS)
+    df = df.assign(**sample_metrics(df.index, sample_anomalies))
+
+    # Índice por equipo y última toma por equipo (con las etiquetas de df)
+    history_index = build_history_index(df, config)
+
+    return SimpleNamespace(
+        df=df,
+        rules_index=rules_index,
+        PARAMS=PARAMS,
+        PARAM_GROUPS=PARAM_GROUPS,
+        sample_anomalies=sample_anomalies,
+        history_index=history_index,
+        latest_rows=latest_samples(history_index),
+    )
+
+
+def critical_params(params, rules):
+    return [p for p in params if p["col"] in rules.critical_indicators]
+
+
+def fleet_projections(evaluation, config, last_n):
+    # Tiempo a límite de los parámetros críticos, como en las perspectivas predictivas
+    return projectable_trends(trend_regressions(
+        evaluation.history_index,
+        evaluation.latest_rows,
+        config,
+        critical_params(evaluation.PARAMS, evaluation.rules_index),
+        last_n,
+    ))
@@ -2,197 +2,105 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
-import networkx as nx
-import scipy
-from data import enrich_anomalies_with_severity, detect_anomalies, compute_row_metrics
-from data import SEVERITY, SEVERITY_PRIORITY_ORDER_ASC, PARAMS, PARAM_GROUPS
+from pipeline import trend_regressions, projectable_trends, risk_trends, RISK_TTL_MAX
+from pipeline import downsample_minmax, fecha_seconds
+from data import SEVERITY, SEVERITY_PRIORITY_ORDER_ASC, add_historico_band
+import perf
 
-import data
 
-def render_analisis_tab():
+@perf.timed_function()
+def render_analisis_tab(ctx):
     st.header("Análisis Avanzado")
 
-    #VARIABLES
-    
-    config = data.config
-    df = data.df.copy()
-    df_historico = data.df_historico.copy()
-    df_completo = data.df_completo.copy()
-    df_acciones = data.df_acciones.copy()
-    latest_df = data.latest_df.copy()
-    latest_anomalies = data.latest_anomalies
-    PARAMS = data.PARAMS 
-    PARAM_GROUPS = data.PARAM_GROUPS
+    # Call independent fragments
+    historical_trends_fragment(ctx)
+    parameter_evolution_fragment(ctx)
+    correlations_fragment(ctx)
+    predictive_fragment(ctx)
 
-    # Cache shared computations (fast, computed once per session)
-    if 'indicator_emoji' not in st.session_state:
-        indicator_emoji = {}
-        name_to_priority = {info["name"]: info["priority"] for info in SEVERITY.values()}
-        for p in PARAMS:
-            name = p["name"]
-            col = p["col"]
-            # Todas las severidades típicas de este indicador (pueden ser varias)
-            severidades = df_acciones[df_acciones["Indicador"] == col]["Severidad Típica"].dropna().unique()
-            # Si hay alguna, tomamos la peor (la de mayor priority)
-            if len(severidades) > 0:
-                priorities = [
-                    name_to_priority.get(sev.strip(), 0)
-                    for sev in severidades
-                ]
-                max_priority = max(priorities)
-            else:
-                max_priority = 0  # Sano por defecto
-            indicator_emoji[name] = SEVERITY[max_priority]["emoji"]
-        st.session_state.indicator_emoji = indicator_emoji
 
-    if 'corr_matrix' not in st.session_state:
-        corr_cols = [p["col"] for p in PARAMS if p["col"] in df.select_dtypes(include=['float64', 'int64']).columns]
-        corr_matrix = df[corr_cols].corr().round(3)
-        st.session_state.corr_cols = corr_cols
-        st.session_state.corr_matrix = corr_matrix
+def add_fleet_trendline(fig, trend, y_label, x_label, fechas=False):
+    # Recta OLS de flota precalculada en la carga (ctx.fleet_trends), en lugar de trendline="ols"
+    if not trend["n"] >= 2 or np.isnan(trend["slope"]):
+        return
+    x = np.array([trend["x_min"], trend["x_max"]])
+    y = trend["slope"] * x + trend["intercept"]
+    if fechas:
+        x = pd.to_datetime(x, unit="s")
+    fig.add_trace(go.Scatter(
+        x=x,
+        y=y,
+        mode="lines",
+        name="Tendencia de flota",
+        line=dict(color="black"),
+        hovertemplate=(
+            f"<b>Tendencia OLS</b><br>{y_label} = {trend['slope']:.6g} * {x_label} + {trend['intercept']:.6g}"
+            f"<br>R<sup>2</sup>={trend['r2']:.6f}<br>n={int(trend['n'])}<extra></extra>"
+        ),
+    ))
 
-    # Call independent fragments
-    historical_trends_fragment()
-    parameter_evolution_fragment()
-    correlations_fragment()
-    predictive_fragment()
+
+def fleet_scatter(plot_df, x_values, config, **scatter_args):
+    # Dispersión de toda la flota: por encima de config.scatter_point_budget se dibuja con WebGL
+    # y solo con el mínimo y el máximo de cada tramo de x (mismos picos y rango, JSON acotado)
+    x_values = np.asarray(x_values, dtype=float)
+    plottable = ~np.isnan(x_values) & plot_df[scatter_args["y"]].notna().to_numpy()
+    plot_df, x_values = plot_df[plottable], x_values[plottable]
+
+    budget = config.scatter_point_budget
+    total = len(plot_df)
+    color = scatter_args.get("color")
+    single_trace = color is not None and (total > budget or plot_df[color].nunique() > config.scatter_max_traces)
+    if total > budget:
+        keep = downsample_minmax(x_values, plot_df[scatter_args["y"]], budget)
+        plot_df = plot_df.iloc[keep]
+        scatter_args["render_mode"] = "webgl"
+    if single_trace:
+        # Una traza por equipo serían miles de trazas: una sola, con el color del equipo en
+        # marker.color y el equipo en el hover
+        del scatter_args["color"]
+        scatter_args["hover_data"] = [color]
+    fig = px.scatter(plot_df, **scatter_args)
+    if single_trace:
+        palette = np.array(px.colors.qualitative.Plotly)
+        codes = pd.Categorical(plot_df[color]).codes
+        fig.update_traces(marker_color=palette[codes % len(palette)])
+    if len(plot_df) < total:
+        st.caption(f"Mostrando {len(plot_df):,} de {total:,} tomas (mínimo y máximo por tramo), con WebGL.")
+    if single_trace:
+        st.caption("Demasiados equipos para la leyenda: color por equipo en una sola traza (equipo en el hover).")
+    return fig
 
 
 @st.fragment
-def historical_trends_fragment():
+@perf.timed_function()
+def historical_trends_fragment(ctx):
     
 
     #VARIABLES
     
-    config = data.config
-    df = data.df.copy()
-    df_historico = data.df_historico.copy()
-    df_completo = data.df_completo.copy()
-    df_acciones = data.df_acciones.copy()
-    latest_df = data.latest_df.copy()
-    latest_anomalies = data.latest_anomalies
-    PARAMS = data.PARAMS 
-    PARAM_GROUPS = data.PARAM_GROUPS
+    config = ctx.config
+    df = ctx.df
+    df_historico = ctx.df_historico
+    df_acciones = ctx.df_acciones
+    latest_df = ctx.latest_df
+    latest_anomalies = ctx.latest_anomalies
+    rules_index = ctx.rules_index
+    sample_anomalies = ctx.sample_anomalies
+    PARAMS = ctx.PARAMS 
+    PARAM_GROUPS = ctx.PARAM_GROUPS
     
     st.subheader("📈 Tendencias históricas")
-    ## Calculos internos
-    fleet_size = len(latest_df)
-    df_with_priority = df.copy()
-    df_with_priority["max_priority"] = df.apply(
-        lambda row: compute_row_metrics(row, PARAMS, df_acciones)[0],
-        axis=1
-    )
-    df_with_priority[config.col_fecha] = pd.to_datetime(df_with_priority[config.col_fecha])
-    fecha_periods = df_with_priority[config.col_fecha].dt.to_period('M')
-    min_period = fecha_periods.min()
-    max_period = fecha_periods.max()
-    monthly_dates = pd.date_range(
-        min_period.start_time,
-        max_period.end_time,
-        freq="M"
-    )
-    trend_rows = []
-    ## Anomalías por grupo (conteo y %)
-    group_trend_counts = {g: [] for g in PARAM_GROUPS}
-    group_trend_pct = {g: [] for g in PARAM_GROUPS}
-    ## --- NUEVO: indicadores con distinción Alta/Baja ---
-    all_display_indicators = []
-    indicator_to_group = {}  # grupo sigue siendo el mismo para Alta y Baja del mismo indicador
-    for p in PARAMS:
-        name = p["name"]
-        group = p["group"]
-        if p.get("min_val") is not None:
-            display = f"{name} (Baja)"
-            all_display_indicators.append(display)
-            indicator_to_group[display] = group
-        if p.get("max_val") is not None:
-            display = f"{name} (Alta)"
-            all_display_indicators.append(display)
-            indicator_to_group[display] = group
-    ## Anomalías por indicador, separadas por severidad
-    indicator_trend_counts_by_sev = {
-        prio: {ind: [] for ind in all_display_indicators}
-        for prio in [3, 2, 1]
-    }
-    indicator_trend_pct_by_sev = {
-        prio: {ind: [] for ind in all_display_indicators}
-        for prio in [3, 2, 1]
-    }
-    for month_end in monthly_dates:
-        snapshot = df_with_priority[df_with_priority[config.col_fecha] <= month_end]
-        if snapshot.empty:
-            trend_rows.append({
-                "date": month_end,
-                "fleet_size": 0,
-                **{f"pct_{i}": 0 for i in range(4)},
-                **{f"count_{i}": 0 for i in range(4)}
-            })
-            for g in PARAM_GROUPS:
-                group_trend_counts[g].append(0)
-                group_trend_pct[g].append(0)
-            for prio in [3, 2, 1]:
-                for ind in all_display_indicators:
-                    indicator_trend_counts_by_sev[prio][ind].append(0)
-                    indicator_trend_pct_by_sev[prio][ind].append(0)
-            continue
-        latest_snapshot = snapshot.loc[snapshot.groupby(config.col_equipos)[config.col_horometro].idxmax()]
-        ### Severidad (% de equipos)
-        sev_counts = latest_snapshot["max_priority"].value_counts().reindex([0,1,2,3], fill_value=0)
-        fleet_month = len(latest_snapshot)
-        raw_pct = sev_counts / fleet_month * 100 if fleet_month > 0 else pd.Series([0]*4, index=[0,1,2,3])
-        pct = raw_pct.round(1)
-        if pct.sum() > 0:
-            difference = 100 - pct.sum()
-            if difference != 0:
-                max_idx = pct.idxmax()
-                pct[max_idx] += difference
-        trend_rows.append({
-            "date": month_end,
-            "fleet_size": fleet_month,
-            **{f"pct_{i}": pct[i] for i in range(4)},
-            **{f"count_{i}": sev_counts[i] for i in range(4)}
-        })
-        ### Anomalías
-        snapshot_anomalies = []
-        for _, row in latest_snapshot.iterrows():
-            anom = detect_anomalies(row, PARAMS)
-            enriched = enrich_anomalies_with_severity(anom, df_acciones)
-            snapshot_anomalies.extend(enriched)
-        total_anomalies_month = len(snapshot_anomalies)
-        if snapshot_anomalies:
-            df_snap_anom = pd.DataFrame(snapshot_anomalies)
-            ### Por grupo
-            group_counts = df_snap_anom["grupo"].value_counts()
-            for g in PARAM_GROUPS:
-                count = group_counts.get(g, 0)
-                group_trend_counts[g].append(count)
-                pct_val = (count / total_anomalies_month * 100) if total_anomalies_month > 0 else 0
-                group_trend_pct[g].append(pct_val)
-            ### Totals por severidad para este mes
-            total_per_sev = {3: 0, 2: 0, 1: 0}
-            sev_counts_month = df_snap_anom["priority"].value_counts()
-            for prio in [3, 2, 1]:
-                total_per_sev[prio] = sev_counts_month.get(prio, 0)
-            ### Por indicador y severidad (usando display_indicator)
-            grouped = df_snap_anom.groupby(["display_indicator", "priority"]).size().unstack(fill_value=0)
-            for prio in [3, 2, 1]:
-                total_this_sev = total_per_sev[prio]
-                for ind in all_display_indicators:
-                    count = grouped[prio].get(ind, 0) if prio in grouped.columns else 0
-                    indicator_trend_counts_by_sev[prio][ind].append(count)
-                    pct_val = (count / total_this_sev * 100) if total_this_sev > 0 else 0
-                    indicator_trend_pct_by_sev[prio][ind].append(round(pct_val, 1))
-        else:
-            for g in PARAM_GROUPS:
-                group_trend_counts[g].append(0)
-                group_trend_pct[g].append(0)
-            for prio in [3, 2, 1]:
-                for ind in all_display_indicators:
-                    indicator_trend_counts_by_sev[prio][ind].append(0)
-                    indicator_trend_pct_by_sev[prio][ind].append(0)
-    df_trend = pd.DataFrame(trend_rows)
+    ## Calculos internos (barrido único por fecha, una vez por conjunto de datos; ver pipeline.monthly_fleet_trends)
+    trends = ctx.monthly_trends
+    df_trend = trends.df_trend
+    group_trend_counts = trends.group_trend_counts
+    group_trend_pct = trends.group_trend_pct
+    all_display_indicators = trends.all_display_indicators
+    indicator_to_group = trends.indicator_to_group
+    indicator_trend_counts_by_sev = trends.indicator_trend_counts_by_sev
+    indicator_trend_pct_by_sev = trends.indicator_trend_pct_by_sev
     ## Gráfico 1: % de la flota por severidad
     fig_trend_pct = go.Figure()
     for priority in SEVERITY_PRIORITY_ORDER_ASC:
@@ -271,26 +179,29 @@ def historical_trends_fragment():
 
 
 @st.fragment
-def parameter_evolution_fragment():
+@perf.timed_function()
+def parameter_evolution_fragment(ctx):
     st.subheader("Análisis General: ¿Qué impulsa los patrones actuales?")
 
 
     
     #VARIABLES
     
-    config = data.config
-    df = data.df.copy()
-    df_historico = data.df_historico.copy()
-    df_completo = data.df_completo.copy()
-    df_acciones = data.df_acciones.copy()
-    latest_df = data.latest_df.copy()
-    latest_anomalies = data.latest_anomalies
-    PARAMS = data.PARAMS 
-    PARAM_GROUPS = data.PARAM_GROUPS
+    config = ctx.config
+    df = ctx.df
+    df_historico = ctx.df_historico
+    df_acciones = ctx.df_acciones
+    latest_df = ctx.latest_df
+    latest_anomalies = ctx.latest_anomalies
+    rules_index = ctx.rules_index
+    PARAMS = ctx.PARAMS 
+    PARAM_GROUPS = ctx.PARAM_GROUPS
 
 
     
-    indicator_emoji = st.session_state.indicator_emoji
+    indicator_emoji = ctx.indicator_emoji
+    fleet_trends = ctx.fleet_trends
+    fleet_summary = ctx.fleet_summary
     ### Filtro
     parametro = st.selectbox(
         "Selecciona un parámetro",
@@ -308,83 +219,86 @@ def parameter_evolution_fragment():
         min_val = max_val = col_name = None
     ## Gráfico 1: Indicador vs horómetro
     st.markdown("**Evolución de Parámetros vs Horómetro**")
-    fig_hor = px.scatter(
-        df,
+    fig_hor = fleet_scatter(
+        df[[config.col_horometro, col_name, config.col_equipos]],
+        pd.to_numeric(df[config.col_horometro], errors="coerce"),
+        config,
         x = config.col_horometro,
         y = col_name,
         color = config.col_equipos,
-        trendline = "ols",
-        trendline_scope = "overall",
         title = f"{parametro} vs Horómetro (tendencia de flota)"
     )
+    add_fleet_trendline(fig_hor, fleet_trends.loc[(col_name, "horometro")], col_name, config.col_horometro)
     if min_val is not None:
         fig_hor.add_hline(y=min_val, line_color="orange", line_dash="dash", annotation_text="Mínimo")
     if max_val is not None:
         fig_hor.add_hline(y=max_val, line_color="red", line_dash="dash", annotation_text="Máximo")
-    if parametro in df_historico.columns:
-        hist_mean = df_historico[parametro].mean()
-        hist_sd = df_historico[parametro].std()
-        fig_hor.add_hline(y=hist_mean, line_color="black", line_dash="dash", annotation_text="Media histórica")
-        fig_hor.add_hrect(
-            y0=hist_mean - hist_sd,
-            y1=hist_mean + hist_sd,
-            fillcolor="gray",
-            opacity=0.2,
-            line_width=0,
-            annotation_text="±1 SD histórico"
-        )
+    if col_name in df_historico.columns:
+        ## Línea base de flota por tramo de horómetro: media y banda p10–p90
+        add_historico_band(fig_hor, df_historico, config, col_name, fillcolor="rgba(128, 128, 128, 0.2)")
+        fig_hor.add_trace(go.Scatter(
+            x = df_historico[config.col_horometro],
+            y = df_historico[col_name],
+            mode = "lines",
+            name = "Media histórica",
+            line = dict(color="black", dash="dash"),
+            customdata = df_historico[f"{col_name}_count"],
+            hovertemplate = "Media histórica: %{y:.2f} (%{customdata} tomas)<extra></extra>"
+        ))
     st.plotly_chart(fig_hor, use_container_width=True)
     ## Gráfico 2: Time-Based Graph
     st.markdown("**Evolución de Parámetros vs Fecha**")
-    df[config.col_fecha] = pd.to_datetime(df[config.col_fecha], errors='coerce')
-    df_plot = df[[config.col_fecha, col_name, config.col_equipos]].dropna(subset=[config.col_fecha, col_name])
-    fig_time = px.scatter(
+    df_fechas = ctx.with_columns("df", **{config.col_fecha: pd.to_datetime(df[config.col_fecha], errors='coerce')})
+    df_plot = df_fechas[[config.col_fecha, col_name, config.col_equipos]]
+    fig_time = fleet_scatter(
         df_plot,
+        fecha_seconds(df_plot[config.col_fecha]),
+        config,
         x = config.col_fecha,
         y = col_name,
         color = config.col_equipos,
-        trendline = "ols",
-        trendline_scope = "overall",
         title = f"{parametro} vs Fecha (tendencia de flota)"
     )
+    add_fleet_trendline(fig_time, fleet_trends.loc[(col_name, "fecha")], col_name, config.col_fecha, fechas=True)
     if min_val is not None:
         fig_time.add_hline(y=min_val, line_color="orange", line_dash="dash", annotation_text="Mínimo")
     if max_val is not None:
         fig_time.add_hline(y=max_val, line_color="red", line_dash="dash", annotation_text="Máximo")
-    if parametro in df_historico.columns:
-        fig_time.add_hline(y=hist_mean, line_color="black", line_dash="dash", annotation_text="Media histórica")
+    if col_name in fleet_summary.index:
+        hist = fleet_summary.loc[col_name]
+        fig_time.add_hline(y=hist["mean"], line_color="black", line_dash="dash", annotation_text="Media histórica")
         fig_time.add_hrect(
-            y0=hist_mean - hist_sd,
-            y1=hist_mean + hist_sd,
+            y0=hist["p10"],
+            y1=hist["p90"],
             fillcolor="gray",
             opacity=0.2,
             line_width=0,
-            annotation_text="±1 SD histórico"
+            annotation_text="p10–p90 histórico"
         )
     st.plotly_chart(fig_time, use_container_width=True)
 
 
 @st.fragment
-def correlations_fragment():
+@perf.timed_function()
+def correlations_fragment(ctx):
     st.markdown("**Relaciones Fuertes entre Parámetros**")
 
     
     #VARIABLES
     
-    config = data.config
-    df = data.df.copy()
-    df_historico = data.df_historico.copy()
-    df_completo = data.df_completo.copy()
-    df_acciones = data.df_acciones.copy()
-    latest_df = data.latest_df.copy()
-    latest_anomalies = data.latest_anomalies
-    PARAMS = data.PARAMS 
-    PARAM_GROUPS = data.PARAM_GROUPS
+    config = ctx.config
+    df = ctx.df
+    df_historico = ctx.df_historico
+    df_acciones = ctx.df_acciones
+    latest_df = ctx.latest_df
+    latest_anomalies = ctx.latest_anomalies
+    rules_index = ctx.rules_index
+    PARAMS = ctx.PARAMS 
+    PARAM_GROUPS = ctx.PARAM_GROUPS
 
     
-    corr_cols = st.session_state.corr_cols
-    corr_matrix = st.session_state.corr_matrix
-    indicator_emoji = st.session_state.indicator_emoji
+    corr_cols, corr_matrix = ctx.correlations
+    indicator_emoji = ctx.indicator_emoji
     ## Filtro indicador
     anchor_param = st.selectbox(
         "Selecciona un parámetro para analizar correlaciones",
@@ -409,6 +323,7 @@ def correlations_fragment():
             st.write("No hay correlaciones por encima del umbral seleccionado.")
         ## Mapa de Propagación de Anomalías
         st.markdown("**Mapa de Propagación de Anomalías**")
+        import networkx as nx  # solo se carga cuando se dibuja el mapa
         G = nx.Graph()
         anchor_col = next(p["col"] for p in PARAMS if p["name"] == anchor_param)
         for other_col in corr_cols:
@@ -456,26 +371,26 @@ def correlations_fragment():
 
 
 @st.fragment
-def predictive_fragment():
+@perf.timed_function()
+def predictive_fragment(ctx):
 
     
     #VARIABLES
     
-    config = data.config
-    df = data.df.copy()
-    df_historico = data.df_historico.copy()
-    df_completo = data.df_completo.copy()
-    df_acciones = data.df_acciones.copy()
-    latest_df = data.latest_df.copy()
-    latest_anomalies = data.latest_anomalies
-    PARAMS = data.PARAMS 
-    PARAM_GROUPS = data.PARAM_GROUPS
+    config = ctx.config
+    df = ctx.df
+    df_historico = ctx.df_historico
+    df_acciones = ctx.df_acciones
+    latest_df = ctx.latest_df
+    latest_anomalies = ctx.latest_anomalies
+    rules_index = ctx.rules_index
+    PARAMS = ctx.PARAMS 
+    PARAM_GROUPS = ctx.PARAM_GROUPS
 
     
     st.subheader("Perspectivas Predictivas: ¿Qué podría pasar después?")
     fleet_size = len(latest_df)  # Duplicated here (fast, keeps original behavior)
-    corr_matrix = st.session_state.corr_matrix
-    corr_cols = st.session_state.corr_cols
+    corr_cols, corr_matrix = ctx.correlations
     # Inout de número de muestras
     N = st.number_input(
         "Número de últimas tomas para proyecciones (default 5, min 3)",
@@ -489,89 +404,42 @@ def predictive_fragment():
     st.markdown("**Advertencia para Equipos No Críticos**")
     non_critical_df = latest_df[latest_df["max_priority"] < 3]
     non_critical_pct = len(non_critical_df) / fleet_size * 100 if fleet_size > 0 else 0
-    critical_params = [
-        p for p in PARAMS
-        if df_acciones[(df_acciones["Indicador"] == p["col"]) & (df_acciones["Severidad Típica"] == SEVERITY[3]["name"])].shape[0] > 0
-    ]
-    at_risk_count = 0
-    for _, row in non_critical_df.iterrows():
-        eq = row[config.col_equipos]
-        eq_hist = df[df[config.col_equipos] == eq].sort_values(config.col_horometro).tail(N)
-        if len(eq_hist) < 3: continue
-        for p in critical_params:
-            col = p["col"]
-            val = row.get(col)
-            if pd.isna(val): continue
-            limit = p["max_val"] if p["max_val"] is not None else p["min_val"]
-            is_min = p["max_val"] is None
-            valid_last = eq_hist[[config.col_horometro, col]].dropna()
-            if len(valid_last) < 3: continue
-            x = valid_last[config.col_horometro]
-            y = valid_last[col]
-            slope, intercept, r_value, _, _ = scipy.stats.linregress(x, y)
-            if abs(slope) < 1e-6: continue
-            if (is_min and slope > 0) or (not is_min and slope < 0): continue
-            ttl = (limit - val) / slope if not is_min else (val - limit) / -slope
-            if 0 < ttl < 10000:
-                at_risk_count += 1
-                break
+    critical_params = [p for p in PARAMS if p["col"] in rules_index.critical_indicators]
+    # Regresiones de todos los pares (equipo, parámetro crítico) en una sola pasada
+    with perf.timed("trend_regressions"):
+        trends = projectable_trends(trend_regressions(ctx.history_index, latest_df, config, critical_params, N))
+    trends = trends[trends["equipo"].isin(non_critical_df[config.col_equipos])]
+    at_risk_count = trends.loc[(trends["ttl"] > 0) & (trends["ttl"] < RISK_TTL_MAX), "equipo"].nunique()
     at_risk_pct = (at_risk_count / len(non_critical_df) * 100) if len(non_critical_df) > 0 else 0
     st.info(f"De los {non_critical_pct:.0f}% equipos no críticos (incluye atención/precaución), ≈{at_risk_pct:.0f}% podrían escalar a crítico en <10,000h (basado en últimas {N} tomas).")
     # Calculus según muestras a tomar
     risks = []
-    risk_details = {}  # Store per-eq ttl list for details
-    for _, row in latest_df.iterrows():
-        eq = row[config.col_equipos]
-        anoms = detect_anomalies(row, PARAMS)
-        enriched = enrich_anomalies_with_severity(anoms, df_acciones)
-        if any(a["priority"] == 3 for a in enriched): continue  # Skip if already critical
-        eq_hist = df[df[config.col_equipos] == eq].sort_values(config.col_horometro)
-        if len(eq_hist) < 3: continue
-        eq_hist_last = eq_hist.tail(N)
-        if len(eq_hist_last) < 3:
-            eq_hist_last = eq_hist  # Fallback to all
-        eq_ttl = []
-        for p in critical_params:
-            col = p["col"]
-            if col not in eq_hist_last.columns: continue
-            val = row.get(col)
-            if pd.isna(val): continue
-            limit = p["max_val"] if p["max_val"] is not None else p["min_val"]
-            is_min = p["max_val"] is None
-            valid_last = eq_hist_last[[config.col_horometro, col]].dropna()
-            if len(valid_last) < 3: continue
-            x = valid_last[config.col_horometro]
-            y = valid_last[col]
-            slope, intercept, r_value, _, _ = scipy.stats.linregress(x, y)
-            if abs(slope) < 1e-6: continue
-            if (is_min and slope > 0) or (not is_min and slope < 0): continue
-            ttl = (limit - val) / slope if not is_min else (val - limit) / -slope
-            if ttl <= 0 or ttl > 10000: continue
-            r2 = r_value ** 2
-            if r2 < 0.3: continue  # Skip low confidence fits
-            eq_ttl.append((p["name"], ttl, col, slope, intercept, r2, valid_last))
-        if eq_ttl:
-            min_ttl = min([t[1] for t in eq_ttl])
-            min_ind = ", ".join([t[0] for t in eq_ttl if t[1] == min_ttl])
-            ind_at_risk = ", ".join([t[0] for t in eq_ttl])
-            risks.append({
-                "Equipo": eq,
-                "Horas proyectadas a volverse critico": round(min_ttl, 0),
-                "Indicador Causante": min_ind,
-                "Indicadores en Riesgo": ind_at_risk
-            })
-            risk_details[eq] = eq_ttl  # Store for details consistency
+    risk_details = {}  # Store per-eq ttl rows for details
+    at_risk = risk_trends(trends, latest_df, config)  # Skip low confidence fits (mismo filtro que batch.py)
+    for eq, eq_ttl in at_risk.groupby("equipo", sort=False):
+        min_ttl = eq_ttl["ttl"].min()
+        min_ind = ", ".join(eq_ttl.loc[eq_ttl["ttl"] == min_ttl, "name"])
+        ind_at_risk = ", ".join(eq_ttl["name"])
+        risks.append({
+            "Equipo": eq,
+            "Horas proyectadas a volverse critico": round(min_ttl, 0),
+            "Indicador Causante": min_ind,
+            "Indicadores en Riesgo": ind_at_risk
+        })
+        risk_details[eq] = eq_ttl  # Store for details consistency
     if risks:
         risk_df = pd.DataFrame(risks).sort_values("Horas proyectadas a volverse critico")
         st.warning(f"¡Revisa estos equipos ahora! Podrían alcanzar límites críticos pronto (top 10 mostrados, basado en últimas {N} tomas):")
         st.dataframe(risk_df.head(10))
         selected_eq = st.selectbox("Selecciona un equipo para ver detalles predictivos", risk_df["Equipo"], key="eq_risk_select")
         if selected_eq:
-            eq_hist = df[df[config.col_equipos] == selected_eq].sort_values(config.col_horometro)
-            row = latest_df[latest_df[config.col_equipos] == selected_eq].iloc[0]
-            eq_ttl_sorted = sorted(risk_details.get(selected_eq, []), key=lambda x: x[1])  # Use pre-computed, sorted by ttl
+            eq_hist = ctx.history(selected_eq)
+            row = ctx.latest_sample(selected_eq)
+            eq_ttl_sorted = risk_details[selected_eq].sort_values("ttl", kind="stable")  # Use pre-computed, sorted by ttl
+            eq_hist_last = ctx.last_samples(selected_eq, N)
             st.subheader(f"Proyecciones para {selected_eq}")
-            for ind, ttl, col, slope, intercept, r2, valid_last in eq_ttl_sorted:
+            for ind, ttl, col, slope, intercept, r2 in eq_ttl_sorted[["name", "ttl", "col", "slope", "intercept", "r2"]].itertuples(index=False):
+                valid_last = eq_hist_last[[config.col_horometro, col]].dropna()
                 conf_note = f" (confianza: {round(r2, 2)} R²)" if r2 < 0.5 else ""
                 st.write(f"**{ind}**: ~{round(ttl)} horas a límite (asumiendo tendencia lineal; pendiente: {round(slope * 1000, 2)} por 1000h{conf_note}).")
                 fig_mini = go.Figure()
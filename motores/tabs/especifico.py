@@ -1,32 +1,35 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import data
+import numpy as np
 
 #from ai import render_ai_chat_esp
-from data import create_indicator_chart, get_worst_severity, enrich_anomalies_with_severity, compute_row_metrics, style_row
-from data import latest_anomalies
-from data import SEVERITY, SEVERITY_PRIORITY_ORDER_ASC, PARAMS, PARAM_GROUPS
-from data import df, df_completo, config, df_acciones
+from pipeline import lookup_rule
+from data import cached_indicator_chart, style_anomalies, SAMPLE_METRIC_COLUMNS
+from data import SEVERITY, SEVERITY_PRIORITY_ORDER_ASC
+import perf
+
+# Filas de la "Tabla General" por página
+TABLE_PAGE_SIZE = 50
 
 @st.fragment
-def render_especifico_tab():
+@perf.timed_function()
+def render_especifico_tab(ctx):
 
     st.header("Análisis de Condición Motores Diesel por Equipo")
 
     
     #VARIABLES
     
-    config = data.config
-    df = data.df.copy()
-    df_historico = data.df_historico.copy()
-    df_completo = data.df_completo.copy()
-    df_acciones = data.df_acciones.copy()
-    latest_df = data.latest_df.copy()
-    latest_anomalies = data.latest_anomalies
-    PARAMS = data.PARAMS 
-    PARAM_GROUPS = data.PARAM_GROUPS
+    config = ctx.config
+    df = ctx.df
+    df_historico = ctx.df_historico
+    df_acciones = ctx.df_acciones
+    latest_df = ctx.latest_df
+    latest_anomalies = ctx.latest_anomalies
+    rules_index = ctx.rules_index
+    PARAMS = ctx.PARAMS 
+    PARAM_GROUPS = ctx.PARAM_GROUPS
 
     # TODO: Filtro
 
@@ -35,11 +38,12 @@ def render_especifico_tab():
     equipo_data = []
     all_equipos = sorted(df[config.col_equipos].dropna().unique())
 
+    # Severidad de la última toma, materializada en la carga
+    latest_by_equipo = latest_df.set_index(config.col_equipos)
+
     for eq in all_equipos:
-        anomalies = latest_anomalies.get(eq, [])
-        
         # Get worst severity priority (0 = no issue / green)
-        worst_priority = get_worst_severity(anomalies, df_acciones)
+        worst_priority = int(latest_by_equipo.at[eq, "max_priority"])
 
         # Use centralised emoji from SEVERITY
         emoji = SEVERITY[worst_priority]["emoji"]
@@ -63,8 +67,7 @@ def render_especifico_tab():
 
     ## Resultado de la data filtrada
 
-    df_filtered = df.copy()
-    df_filtered = df_filtered[df_filtered[config.col_equipos] == selected_equipo]
+    df_filtered = ctx.history(selected_equipo)
 
     # TODO: Resumen de Condición de la Última Toma
 
@@ -72,41 +75,27 @@ def render_especifico_tab():
 
     ## Get anomalies for this equipment
 
-    anomalies = latest_anomalies.get(selected_equipo, [])
-    enriched_anomalies = enrich_anomalies_with_severity(anomalies, df_acciones)
+    anomalies = latest_anomalies[latest_anomalies["equipo"] == selected_equipo]
 
-    if anomalies:
+    if not anomalies.empty:
 
         ## Mensaje si hay errores
 
         st.error("⚠️ Anomalías detectadas:")
 
-        ## Group by category
-        by_group = {}
-        for anomaly in enriched_anomalies:
-            g = anomaly["grupo"]
-            by_group.setdefault(g, []).append(anomaly)
-
-        ## Show groups in the original params order
-        for group in PARAM_GROUPS:
-            violations = by_group.get(group, [])
-            if not violations:
-                continue
+        ## Group by category (en el orden de PARAMS)
+        for group, violations in anomalies.groupby("grupo", observed=True):
 
             st.markdown(f"##### Anomalías en {group} ({len(violations)})")
 
-            for v in violations:
+            for v in violations.to_dict("records"):
                 ## Lookup in acciones
-                match = df_acciones[
-                    (df_acciones["Indicador"] == v["column"]) &
-                    (df_acciones["Tipo"].str.upper() == v["tipo"])
-                ]
-
-                if not match.empty:
-                    row = match.iloc[0]
-                    posible_motivo    = row.get("Posible Motivo", "No disponible")
-                    accion_recomendada = row.get("Acción Recomendada", "No disponible")
-                    severidad_tipica   = row.get("Severidad Típica", "No disponible")
+                rule = lookup_rule(rules_index, v["column"], v["tipo"])
+
+                if rule is not None:
+                    posible_motivo    = rule["motivo"]
+                    accion_recomendada = rule["accion"]
+                    severidad_tipica   = rule["severidad_tipica"]
                 else:
                     posible_motivo    = "No se encontró motivo específico"
                     accion_recomendada = "No se encontró acción recomendada"
@@ -134,28 +123,30 @@ def render_especifico_tab():
 
     ## Hisotrico de salud del equipo
 
-    equip_df = df[df[config.col_equipos] == selected_equipo].sort_values(config.col_horometro).reset_index(drop=True)
-
-    metrics_eq = equip_df.apply(
-        lambda row: compute_row_metrics(row, PARAMS, df_acciones),
-        axis=1
-    )
-    equip_df["max_priority"] = [m[0] for m in metrics_eq]
-    equip_df["anomaly_count"] = [m[1] for m in metrics_eq]
-    equip_df["enriched"] = [m[2] for m in metrics_eq]
+    # max_priority / anomaly_count ya vienen en df; las anomalías, de la tabla de hechos del contexto
+    equip_df = df_filtered.reset_index(drop=True)
+    equip_anomalies = ctx.anomalies_for(selected_equipo)
 
     ## Grapgh 1: Evolucioón historica de salud
 
     fig_main = go.Figure()
 
-    ### Stepped lines
-    for i in range(len(equip_df) - 1):
-        p = equip_df.iloc[i]["max_priority"]
+    ### Stepped lines: una traza por nivel, tramos [h_i, h_i+1] separados por NaN
+    horometros = equip_df[config.col_horometro].to_numpy(dtype=float)
+    priorities = equip_df["max_priority"].to_numpy()
+    for p in SEVERITY_PRIORITY_ORDER_ASC:
+        starts = np.flatnonzero(priorities[:-1] == p)
+        if len(starts) == 0:
+            continue
+        segments = np.full((len(starts), 3), np.nan)
+        segments[:, 0] = horometros[starts]
+        segments[:, 1] = horometros[starts + 1]
         fig_main.add_trace(go.Scatter(
-            x = [equip_df.iloc[i][config.col_horometro], equip_df.iloc[i+1][config.col_horometro]],
-            y = [p, p],
+            x = segments.ravel(),
+            y = np.where(np.isnan(segments), np.nan, p).ravel(),
             mode = "lines",
             line = dict(color=SEVERITY[p]["color"], width=6),
+            connectgaps = False,
             showlegend = False
         ))
     fig_main.add_trace(go.Scatter(
@@ -180,18 +171,14 @@ def render_especifico_tab():
 
     ## Grapgh 2: Cuenta por tipo de anomalía
 
-    stacked_data = []
-
-    for _, row in equip_df.iterrows():
-        enriched = row["enriched"]
-        if enriched:
-            df_g = pd.DataFrame(enriched)
-            counts = df_g["severidad"].value_counts()
-            for severidad_name, c in counts.items():
-                stacked_data.append({"horometro": row[config.col_horometro], "severidad": severidad_name, "count": c})
-
-    if stacked_data:
-        df_stacked = pd.DataFrame(stacked_data)
+    if not equip_anomalies.empty:
+        df_stacked = (
+            equip_anomalies.groupby(["row", "severidad"], observed=True, sort=False)
+            .size()
+            .reset_index(name="count")
+        )
+        df_stacked["horometro"] = df_filtered.loc[df_stacked["row"], config.col_horometro].to_numpy()
+        df_stacked["severidad"] = df_stacked["severidad"].astype(str)
 
         # Color map by severity name (Crítico, Precaución, Atención)
 
@@ -225,200 +212,134 @@ def render_especifico_tab():
 
     st.markdown("### Gráficos por indicador")
 
-    ## Preparación de df_selected
-
-    min_horo = df_filtered[config.col_horometro].min()
-    max_horo = df_filtered[config.col_horometro].max()
-
-    df_selected = df_completo[
-        (df_completo[config.col_equipos] == selected_equipo) |
-        (df_completo[config.col_equipos] == "Histórico")
-    ].sort_values(config.col_horometro)
-
-    df_selected = df_selected[
-        (df_selected[config.col_horometro] >= min_horo) &
-        (df_selected[config.col_horometro] <= max_horo)
-    ]
-
-    ## ==== Datos operativos / físicos ====
-    st.markdown("#### - Datos operativos / físicos de la muestra")
-
-    cols1 = st.columns(4, gap="small")
-    cols2 = st.columns(2, gap="small")
-
-    plots_operativos = [
-        {"container": cols1[0], "y": config.col_cil_1, "title": "Cilindro 1 (BAR) por Horómetro", "st_key": "graph_cil_1", "min_fixed": config.cil_min, "max_fixed": config.cil_max},
-        {"container": cols1[1], "y": config.col_cil_2, "title": "Cilindro 2 (BAR) por Horómetro", "st_key": "graph_cil_2", "min_fixed": config.cil_min, "max_fixed": config.cil_max},
-        {"container": cols1[2], "y": config.col_cil_3, "title": "Cilindro 3 (BAR) por Horómetro", "st_key": "graph_cil_3", "min_fixed": config.cil_min, "max_fixed": config.cil_max},
-        {"container": cols1[3], "y": config.col_cil_4, "title": "Cilindro 4 (BAR) por Horómetro", "st_key": "graph_cil_4", "min_fixed": config.cil_min, "max_fixed": config.cil_max},
-        {"container": cols2[0], "y": config.col_p_carter, "title": "Presión del carter (mmH₂O) por Horómetro", "st_key": "graph_p_carter", "use_data_min": True, "max_fixed": config.p_carter_max},
-        {"container": cols2[1], "y": config.col_temp_radiador, "title": "▲ Temperatura Refrigerante en Radiador por Horómetro", "st_key": "graph_temp_radiador", "min_fixed": config.temp_rad_min, "use_data_max": True},
+    ## Grupos de gráficos: solo se construyen (y se envían) los grupos seleccionados
+
+    chart_groups = [
+        {"label": "Operativos", "title": "Datos operativos / físicos de la muestra", "layout": [4, 2], "plots": [
+            {"y": config.col_cil_1, "title": "Cilindro 1 (BAR) por Horómetro", "st_key": "graph_cil_1", "min_fixed": config.cil_min, "max_fixed": config.cil_max},
+            {"y": config.col_cil_2, "title": "Cilindro 2 (BAR) por Horómetro", "st_key": "graph_cil_2", "min_fixed": config.cil_min, "max_fixed": config.cil_max},
+            {"y": config.col_cil_3, "title": "Cilindro 3 (BAR) por Horómetro", "st_key": "graph_cil_3", "min_fixed": config.cil_min, "max_fixed": config.cil_max},
+            {"y": config.col_cil_4, "title": "Cilindro 4 (BAR) por Horómetro", "st_key": "graph_cil_4", "min_fixed": config.cil_min, "max_fixed": config.cil_max},
+            {"y": config.col_p_carter, "title": "Presión del carter (mmH₂O) por Horómetro", "st_key": "graph_p_carter", "use_data_min": True, "max_fixed": config.p_carter_max},
+            {"y": config.col_temp_radiador, "title": "▲ Temperatura Refrigerante en Radiador por Horómetro", "st_key": "graph_temp_radiador", "min_fixed": config.temp_rad_min, "use_data_max": True},
+        ]},
+        {"label": "Aceite", "title": "Condición del aceite", "layout": [4, 3], "plots": [
+            {"y": config.col_viscosidad, "title": "Viscosidad por Horómetro", "st_key": "graph_viscosidad", "min_fixed": config.visc_min, "max_fixed": config.visc_max},
+            {"y": config.col_oxidacion, "title": "Oxidación por Horómetro", "st_key": "graph_oxidacion", "use_data_min": True, "max_fixed": config.oxidacion_max},
+            {"y": config.col_sulfatacion, "title": "Sulfatación por Horómetro", "st_key": "graph_sulfatacion", "use_data_min": True, "max_fixed": config.sulfatacion_max},
+            {"y": config.col_nitratacion, "title": "Nitratación por Horómetro", "st_key": "graph_nitratacion", "use_data_min": True, "max_fixed": config.nitratacion_max},
+            {"y": config.col_tbn, "title": "TBN por Horómetro", "st_key": "graph_tbn", "min_fixed": config.tbn_min, "use_data_max": True},
+            {"y": config.col_hollin, "title": "Hollín (%) por Horómetro", "st_key": "graph_hollin", "use_data_min": True, "max_fixed": config.hollin_max},
+            {"y": config.col_pq, "title": "Indice de Particulas Ferrosas (PQ) por Horómetro", "st_key": "graph_pq", "use_data_min": True, "max_fixed": config.pq_max},
+        ]},
+        {"label": "Contaminación", "title": "Contaminación (o elementos/propiedades contaminantes)", "layout": [3, 3], "plots": [
+            {"y": config.col_agua, "title": "Agua por Horómetro", "st_key": "graph_agua", "use_data_min": True, "max_fixed": config.agua_max},
+            {"y": config.col_diesel, "title": "Diesel por Horómetro", "st_key": "graph_diesel", "use_data_min": True, "max_fixed": config.diesel_max},
+            {"y": config.col_silicio, "title": "Silicio por Horómetro", "st_key": "graph_silicio", "use_data_min": True, "max_fixed": config.silicio_max},
+            {"y": config.col_b, "title": "Boro (B) por Horómetro", "st_key": "graph_boro", "use_data_min": True, "max_fixed": config.b_max},
+            {"y": config.col_na, "title": "Sodio (Na) por Horómetro", "st_key": "graph_na", "use_data_min": True, "max_fixed": config.na_max},
+            {"y": config.col_k, "title": "Potasio (K) por Horómetro", "st_key": "graph_k", "use_data_min": True, "max_fixed": config.k_max},
+        ]},
+        {"label": "Desgaste", "title": "Elementos de desgaste (wear metals)", "layout": [4, 4, 4], "plots": [
+            {"y": config.col_fe, "title": "Fe por Horómetro", "st_key": "graph_fe", "use_data_min": True, "max_fixed": config.fe_max},
+            {"y": config.col_cr, "title": "Cr por Horómetro", "st_key": "graph_cr", "use_data_min": True, "max_fixed": config.cr_max},
+            {"y": config.col_pb, "title": "Pb por Horómetro", "st_key": "graph_pb", "use_data_min": True, "max_fixed": config.pb_max},
+            {"y": config.col_cu, "title": "Cu por Horómetro", "st_key": "graph_cu", "use_data_min": True, "max_fixed": config.cu_max},
+            {"y": config.col_sn, "title": "Sn por Horómetro", "st_key": "graph_sn", "use_data_min": True, "max_fixed": config.sn_max},
+            {"y": config.col_al, "title": "Al por Horómetro", "st_key": "graph_al", "use_data_min": True, "max_fixed": config.al_max},
+            {"y": config.col_ni, "title": "Ni por Horómetro", "st_key": "graph_ni", "use_data_min": True, "max_fixed": config.ni_max},
+            {"y": config.col_ag, "title": "Ag por Horómetro", "st_key": "graph_ag", "use_data_min": True, "max_fixed": config.ag_max},
+            {"y": config.col_ti, "title": "Titanio (Ti) por Horómetro", "st_key": "graph_ti", "use_data_min": True, "max_fixed": config.ti_max},
+            {"y": config.col_v, "title": "Vanadio (V) por Horómetro", "st_key": "graph_v", "use_data_min": True, "max_fixed": config.v_max},
+            {"y": config.col_mn, "title": "Manganeso (mn) por Horómetro", "st_key": "graph_mn", "use_data_min": True, "max_fixed": config.mn_max},
+            {"y": config.col_cd, "title": "Cadmio (Cd) por Horómetro", "st_key": "graph_cd", "use_data_min": True, "max_fixed": config.cd_max},
+        ]},
+        {"label": "Aditivos", "title": "Elementos aditivos", "layout": [3, 3], "plots": [
+            {"y": config.col_mg, "title": "Magnesium (Mg) por Horómetro", "st_key": "graph_mg", "min_fixed": config.mg_min, "use_data_max": True},
+            {"y": config.col_ca, "title": "Calcium (Ca) por Horómetro", "st_key": "graph_ca", "min_fixed": config.ca_min, "use_data_max": True},
+            {"y": config.col_ba, "title": "Barium (Ba) por Horómetro", "st_key": "graph_ba", "use_data_min": True, "max_fixed": config.ba_max},
+            {"y": config.col_p, "title": "Phosphorus (P) por Horómetro", "st_key": "graph_p", "min_fixed": config.p_min, "use_data_max": True},
+            {"y": config.col_zn, "title": "Zinc (Zn) por Horómetro", "st_key": "graph_zn", "min_fixed": config.zn_min, "use_data_max": True},
+            {"y": config.col_mo, "title": "Molybdenum (Mo) por Horómetro", "st_key": "graph_mo", "use_data_min": True, "max_fixed": config.mo_max},
+        ]},
     ]
 
-    for p in plots_operativos:
-        with p["container"]:
-            chart_params = {
-                "min_fixed": p.get("min_fixed"),
-                "max_fixed": p.get("max_fixed"),
-                "use_data_min": p.get("use_data_min", False),
-                "use_data_max": p.get("use_data_max", False),
-            }
-            fig = create_indicator_chart(
-                df_selected,
-                p["y"],
-                p["title"],
-                **chart_params
-            )
-            st.plotly_chart(fig, use_container_width=True, key=p["st_key"])
-
-    ## ==== Condición del aceite ====
-    st.markdown("#### - Condición del aceite")
-
-    cols3 = st.columns(4, gap="small")
-    cols4 = st.columns(3, gap="small")
-
-    plots_aceite = [
-        {"container": cols3[0], "y": config.col_viscosidad, "title": "Viscosidad por Horómetro", "st_key": "graph_viscosidad", "min_fixed": config.visc_min, "max_fixed": config.visc_max},
-        {"container": cols3[1], "y": config.col_oxidacion, "title": "Oxidación por Horómetro", "st_key": "graph_oxidacion", "use_data_min": True, "max_fixed": config.oxidacion_max},
-        {"container": cols3[2], "y": config.col_sulfatacion, "title": "Sulfatación por Horómetro", "st_key": "graph_sulfatacion", "use_data_min": True, "max_fixed": config.sulfatacion_max},
-        {"container": cols3[3], "y": config.col_nitratacion, "title": "Nitratación por Horómetro", "st_key": "graph_nitratacion", "use_data_min": True, "max_fixed": config.nitratacion_max},
-        {"container": cols4[0], "y": config.col_tbn, "title": "TBN por Horómetro", "st_key": "graph_tbn", "min_fixed": config.tbn_min, "use_data_max": True},
-        {"container": cols4[1], "y": config.col_hollin, "title": "Hollín (%) por Horómetro", "st_key": "graph_hollin", "use_data_min": True, "max_fixed": config.hollin_max},
-        {"container": cols4[2], "y": config.col_pq, "title": "Indice de Particulas Ferrosas (PQ) por Horómetro", "st_key": "graph_pq", "use_data_min": True, "max_fixed": config.pq_max},
-    ]
+    group_labels = [g["label"] for g in chart_groups]
+    selected_groups = st.pills(
+        "Grupos de indicadores",
+        options = group_labels,
+        selection_mode = "multi",
+        default = group_labels[:1],
+        key = "grupos_graficos_especifico"
+    )
 
-    for p in plots_aceite:
-        with p["container"]:
-            chart_params = {
-                "min_fixed": p.get("min_fixed"),
-                "max_fixed": p.get("max_fixed"),
-                "use_data_min": p.get("use_data_min", False),
-                "use_data_max": p.get("use_data_max", False),
-            }
-            fig = create_indicator_chart(
-                df_selected,
-                p["y"],
-                p["title"],
-                **chart_params
-            )
-            st.plotly_chart(fig, use_container_width=True, key=p["st_key"])
-
-    ##  ==== Contaminación ====
-    st.markdown("#### - Contaminación (o elementos/propiedades contaminantes)")
-
-    cols5 = st.columns(3, gap="small")
-    cols6 = st.columns(3, gap="small")
-
-    plots_contaminacion = [
-        {"container": cols5[0], "y": config.col_agua, "title": "Agua por Horómetro", "st_key": "graph_agua", "use_data_min": True, "max_fixed": config.agua_max},
-        {"container": cols5[1], "y": config.col_diesel, "title": "Diesel por Horómetro", "st_key": "graph_diesel", "use_data_min": True, "max_fixed": config.diesel_max},
-        {"container": cols5[2], "y": config.col_silicio, "title": "Silicio por Horómetro", "st_key": "graph_silicio", "use_data_min": True, "max_fixed": config.silicio_max},
-        {"container": cols6[0], "y": config.col_b, "title": "Boro (B) por Horómetro", "st_key": "graph_boro", "use_data_min": True, "max_fixed": config.b_max},
-        {"container": cols6[1], "y": config.col_na, "title": "Sodio (Na) por Horómetro", "st_key": "graph_na", "use_data_min": True, "max_fixed": config.na_max},
-        {"container": cols6[2], "y": config.col_k, "title": "Potasio (K) por Horómetro", "st_key": "graph_k", "use_data_min": True, "max_fixed": config.k_max},
-    ]
+    ## Gráficos de los grupos seleccionados
+
+    for group in chart_groups:
+        if group["label"] not in selected_groups:
+            continue
+
+        st.markdown(f"#### - {group['title']}")
+
+        containers = [c for n in group["layout"] for c in st.columns(n, gap="small")]
+
+        for container, p in zip(containers, group["plots"]):
+            with container:
+                chart_params = {
+                    "min_fixed": p.get("min_fixed"),
+                    "max_fixed": p.get("max_fixed"),
+                    "use_data_min": p.get("use_data_min", False),
+                    "use_data_max": p.get("use_data_max", False),
+                }
+                # Figura cacheada por (datos, equipo, columna, límites), ver data.cached_indicator_chart
+                fig = cached_indicator_chart(
+                    ctx,
+                    selected_equipo,
+                    p["y"],
+                    p["title"],
+                    **chart_params
+                )
+                st.plotly_chart(fig, use_container_width=True, key=p["st_key"])
 
-    for p in plots_contaminacion:
-        with p["container"]:
-            chart_params = {
-                "min_fixed": p.get("min_fixed"),
-                "max_fixed": p.get("max_fixed"),
-                "use_data_min": p.get("use_data_min", False),
-                "use_data_max": p.get("use_data_max", False),
-            }
-            fig = create_indicator_chart(
-                df_selected,
-                p["y"],
-                p["title"],
-                **chart_params
-            )
-            st.plotly_chart(fig, use_container_width=True, key=p["st_key"])
-
-    ## ==== Elementos de desgaste (wear metals) ====
-    st.markdown("#### - Elementos de desgaste (wear metals)")
-
-    cols7 = st.columns(4, gap="small")
-    cols8 = st.columns(4, gap="small")
-    cols9 = st.columns(4, gap="small")
-
-    plots_desgaste = [
-        {"container": cols7[0], "y": config.col_fe, "title": "Fe por Horómetro", "st_key": "graph_fe", "use_data_min": True, "max_fixed": config.fe_max},
-        {"container": cols7[1], "y": config.col_cr, "title": "Cr por Horómetro", "st_key": "graph_cr", "use_data_min": True, "max_fixed": config.cr_max},
-        {"container": cols7[2], "y": config.col_pb, "title": "Pb por Horómetro", "st_key": "graph_pb", "use_data_min": True, "max_fixed": config.pb_max},
-        {"container": cols7[3], "y": config.col_cu, "title": "Cu por Horómetro", "st_key": "graph_cu", "use_data_min": True, "max_fixed": config.cu_max},
-        {"container": cols8[0], "y": config.col_sn, "title": "Sn por Horómetro", "st_key": "graph_sn", "use_data_min": True, "max_fixed": config.sn_max},
-        {"container": cols8[1], "y": config.col_al, "title": "Al por Horómetro", "st_key": "graph_al", "use_data_min": True, "max_fixed": config.al_max},
-        {"container": cols8[2], "y": config.col_ni, "title": "Ni por Horómetro", "st_key": "graph_ni", "use_data_min": True, "max_fixed": config.ni_max},
-        {"container": cols8[3], "y": config.col_ag, "title": "Ag por Horómetro", "st_key": "graph_ag", "use_data_min": True, "max_fixed": config.ag_max},
-        {"container": cols9[0], "y": config.col_ti, "title": "Titanio (Ti) por Horómetro", "st_key": "graph_ti", "use_data_min": True, "max_fixed": config.ti_max},
-        {"container": cols9[1], "y": config.col_v, "title": "Vanadio (V) por Horómetro", "st_key": "graph_v", "use_data_min": True, "max_fixed": config.v_max},
-        {"container": cols9[2], "y": config.col_mn, "title": "Manganeso (mn) por Horómetro", "st_key": "graph_mn", "use_data_min": True, "max_fixed": config.mn_max},
-        {"container": cols9[3], "y": config.col_cd, "title": "Cadmio (Cd) por Horómetro", "st_key": "graph_cd", "use_data_min": True, "max_fixed": config.cd_max},
-    ]
+    # TODO: Tabla 
 
-    for p in plots_desgaste:
-        with p["container"]:
-            chart_params = {
-                "min_fixed": p.get("min_fixed"),
-                "max_fixed": p.get("max_fixed"),
-                "use_data_min": p.get("use_data_min", False),
-                "use_data_max": p.get("use_data_max", False),
-            }
-            fig = create_indicator_chart(
-                df_selected,
-                p["y"],
-                p["title"],
-                **chart_params
-            )
-            st.plotly_chart(fig, use_container_width=True, key=p["st_key"])
-
-    ## ==== Elementos aditivos ====
-    st.markdown("#### - Elementos aditivos")
-
-    cols10 = st.columns(3, gap="small")
-    cols11 = st.columns(3, gap="small")
-
-    plots_aditivos = [
-        {"container": cols10[0], "y": config.col_mg, "title": "Magnesium (Mg) por Horómetro", "st_key": "graph_mg", "min_fixed": config.mg_min, "use_data_max": True},
-        {"container": cols10[1], "y": config.col_ca, "title": "Calcium (Ca) por Horómetro", "st_key": "graph_ca", "min_fixed": config.ca_min, "use_data_max": True},
-        {"container": cols10[2], "y": config.col_ba, "title": "Barium (Ba) por Horómetro", "st_key": "graph_ba", "use_data_min": True, "max_fixed": config.ba_max},
-        {"container": cols11[0], "y": config.col_p, "title": "Phosphorus (P) por Horómetro", "st_key": "graph_p", "min_fixed": config.p_min, "use_data_max": True},
-        {"container": cols11[1], "y": config.col_zn, "title": "Zinc (Zn) por Horómetro", "st_key": "graph_zn", "min_fixed": config.zn_min, "use_data_max": True},
-        {"container": cols11[2], "y": config.col_mo, "title": "Molybdenum (Mo) por Horómetro", "st_key": "graph_mo", "use_data_min": True, "max_fixed": config.mo_max},
-    ]
+    st.markdown("### Tabla General")
 
-    for p in plots_aditivos:
-        with p["container"]:
-            chart_params = {
-                "min_fixed": p.get("min_fixed"),
-                "max_fixed": p.get("max_fixed"),
-                "use_data_min": p.get("use_data_min", False),
-                "use_data_max": p.get("use_data_max", False),
-            }
-            fig = create_indicator_chart(
-                df_selected,
-                p["y"],
-                p["title"],
-                **chart_params
-            )
-            st.plotly_chart(fig, use_container_width=True, key=p["st_key"])
+    ## Paginación: solo las filas de la página visible se estilan y se envían
 
-    # TODO: Tabla 
+    df_tabla = (df_filtered
+        .drop(columns=SAMPLE_METRIC_COLUMNS)
+        .sort_values(config.col_horometro, ascending=False)
+        .reset_index(drop=True)
+    )
 
-    st.markdown("### Tabla General")
+    n_rows = len(df_tabla)
+    n_pages = max(1, -(-n_rows // TABLE_PAGE_SIZE))
+
+    page = 1
+    if n_pages > 1:
+        page = st.number_input(
+            label = f"Página (de {n_pages})",
+            min_value = 1,
+            max_value = n_pages,
+            value = 1,
+            step = 1,
+            key = f"pagina_tabla_{selected_equipo}"
+        )
+        first = (page - 1) * TABLE_PAGE_SIZE
+        st.caption(f"Tomas {first + 1}–{min(first + TABLE_PAGE_SIZE, n_rows)} de {n_rows} (más recientes primero)")
 
-    ## Añadir estilos y formato para la tabla
+    df_pagina = df_tabla.iloc[(page - 1) * TABLE_PAGE_SIZE: page * TABLE_PAGE_SIZE]
 
-    df_filtered_styled = df_filtered.copy()
-    df_filtered_styled = df_filtered_styled.sort_values(config.col_horometro, ascending=False).reset_index(drop=True)
+    ## Añadir estilos y formato para la tabla (máscara vectorizada, ver data.style_anomalies)
 
     numeric_cols = [p["col"] for p in PARAMS]
 
     format_dict = {col: '{:.2f}' for col in numeric_cols}
     format_dict[config.col_fecha] = '{:%Y-%m-%d}'
 
-    df_filtered_styled = (df_filtered_styled.style
-        .apply(style_row, params=PARAMS, axis=1)
+    df_filtered_styled = (df_pagina.style
+        .apply(style_anomalies, params=PARAMS, axis=None)
         .format(format_dict)
     )
 
@@ -435,7 +356,7 @@ def render_especifico_tab():
 
     # TODO: AI Chat 
 
-    df_filtered_ai = df_filtered.copy()
+    df_filtered_ai = df_filtered
     latest_row = df_filtered_ai.iloc[-1]
 
     #render_ai_chat_esp(df_filtered=df_filtered_ai,latest_row=latest_row,config=config,params=params,anomalies_by_group=anomalies_by_group,groups_order=groups_order)
@@ -1,25 +1,24 @@
 import streamlit as st
-import pandas as pd
 import plotly.graph_objects as go
-import data
 
 #from ai import render_ai_chat
-from data import enrich_anomalies_with_severity
-from data import SEVERITY, SEVERITY_PRIORITY_ORDER_DESC, PARAM_GROUPS
+from data import SEVERITY, SEVERITY_PRIORITY_ORDER_DESC
+import perf
 
 @st.fragment
-def render_resumen_tab():
+@perf.timed_function()
+def render_resumen_tab(ctx):
 
     #VARIABLES
-    config = data.config
-    df = data.df.copy()
-    df_historico = data.df_historico.copy()
-    df_completo = data.df_completo.copy()
-    df_acciones = data.df_acciones.copy()
-    latest_df = data.latest_df.copy()
-    latest_anomalies = data.latest_anomalies
-    PARAMS = data.PARAMS 
-    PARAM_GROUPS = data.PARAM_GROUPS
+    config = ctx.config
+    df = ctx.df
+    df_historico = ctx.df_historico
+    df_acciones = ctx.df_acciones
+    latest_df = ctx.latest_df
+    latest_anomalies = ctx.latest_anomalies
+    rules_index = ctx.rules_index
+    PARAMS = ctx.PARAMS 
+    PARAM_GROUPS = ctx.PARAM_GROUPS
 
 
     st.header("Resumen General de Condición - Todos los Equipos")
@@ -56,24 +55,18 @@ def render_resumen_tab():
 
     st.subheader("Anomalías actuales con mayor incidencia por nivel de criticidad")
 
-    ## Ver todas las anomalias actuales
+    ## Mostrar resumen de anomalias (tabla de hechos de la última toma)
 
-    all_current_enriched = [a for sublist in latest_df["enriched_anomalies"] for a in sublist]
-
-    ## Mostrar resumen de anomalias
-
-    if not all_current_enriched:
+    if latest_anomalies.empty:
 
         st.success("🎉 ¡No hay anomalías actuales en la flota!")
     
     else:
-
-        df_current_anom = pd.DataFrame(all_current_enriched)
     
         ### Agrupamos por parámetro y severidad máxima
 
         summary = (
-            df_current_anom.groupby("name")
+            latest_anomalies.groupby("name", observed=True)
             .agg(
                 count=("name", "count"),
                 max_priority=("priority", "max")
@@ -113,16 +106,21 @@ def render_resumen_tab():
 
     ## Tabla de Equipos con Problemas
 
-    offenders = latest_df[latest_df["max_priority"] > 0].copy()
+    offenders = latest_df[latest_df["max_priority"] > 0]
 
     if not offenders.empty:
-        def top_groups(enriched):
-            if not enriched:
-                return "-"
-            df_g = pd.DataFrame(enriched)
-            return ", ".join(df_g["grupo"].value_counts().head(2).index)
-
-        offenders["top_grupos"] = offenders["enriched_anomalies"].apply(top_groups)
+        ### Dos grupos con más anomalías por equipo (a igual cuenta, el que aparece antes)
+        group_counts = (
+            latest_anomalies.groupby(["equipo", "grupo"], observed=True, sort=False)
+            .size()
+            .reset_index(name="count")
+            .sort_values("count", ascending=False, kind="stable")
+        )
+        top_grupos = (
+            group_counts.groupby("equipo", observed=True)["grupo"]
+            .agg(lambda grupos: ", ".join(grupos.head(2).astype(str)))
+        )
+        offenders = offenders.assign(top_grupos=offenders[config.col_equipos].map(top_grupos).fillna("-"))
 
         display_cols = [
             config.col_equipos,
@@ -155,40 +153,25 @@ def render_resumen_tab():
 
     ## Data con todas las anomalías
 
-    if latest_anomalies:
-        num = len(latest_anomalies)
+    if not latest_anomalies.empty:
+        num = latest_anomalies["equipo"].nunique()
 
         ## Mensaje resumen
 
         st.error(f"**{num} {'equipo' if num == 1 else 'equipos'} con anomalías detectadas en la última toma:**")
 
-        ## Detalle por equipo
-
-        for equipo in sorted(latest_anomalies.keys()):
+        ## Detalle por equipo (tabla de hechos, grupos en el orden de declaración)
 
-            anomalies = latest_anomalies[equipo]
-
-            enriched_anomalies = enrich_anomalies_with_severity(anomalies, df_acciones)
+        for equipo, equipo_anomalies in latest_anomalies.groupby("equipo", observed=True):
 
             st.markdown(f"**{equipo}**")
 
-            # Group anomalies by their category
-            by_group = {}
-            for anomaly in enriched_anomalies:
-                g = anomaly["grupo"]
-                by_group.setdefault(g, []).append(anomaly)
-
-            # Display groups in the original declaration order
-            for group in PARAM_GROUPS:
-                violations = by_group.get(group, [])
-                if not violations:
-                    continue
+            for group, violations in equipo_anomalies.groupby("grupo", observed=True):
 
                 st.markdown(f"**Anomalías en {group} ({len(violations)}):**")
 
-                for v in violations:
-                    prio = v.get('priority', 0)
-                    st.markdown(f"{SEVERITY[prio]['emoji']} {v['mensaje']} ")
+                for prio, mensaje in zip(violations["priority"], violations["mensaje"]):
+                    st.markdown(f"{SEVERITY[prio]['emoji']} {mensaje} ")
 
             st.markdown("---")
 